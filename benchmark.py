@@ -0,0 +1,328 @@
+"""
+Atelier Benchmark. Copyright (C) 2024 Ikmal Said. All rights reserved.
+
+Runs the Flask app offline against a stand-in AtelierClient, seeds a scratch
+database with users, history and images, then drives it with concurrent
+virtual users and reports per-endpoint throughput and latency percentiles.
+
+    python benchmark.py --users 50 --history 200 --vus 16 --duration 30
+    python benchmark.py --save baseline.json
+    python benchmark.py --compare baseline.json
+"""
+import os
+import sys
+import json
+import time
+import types
+import base64
+import random
+import logging
+import argparse
+import resource
+import tempfile
+import threading
+import urllib.parse
+import urllib.request
+from io import BytesIO
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Stand-in AtelierClient ###############################################
+
+class StubAtelierClient:
+    """Offline AtelierClient replacement with configurable latency and image size"""
+    latency = 0.5
+    image_size = 1024
+
+    def __init__(self, save_as='pil'):
+        """Initialize presets matching the attributes the server reads"""
+        self.logger = logging.getLogger('atelier-benchmark')
+        self.list_atr_styles = ['none', 'anime', 'photographic', 'cinematic']
+        self.list_atr_size = ['1:1', '16:9', '9:16', '4:3']
+        self.list_atr_models = ['flux-turbo', 'flux-pro', 'svi-xl']
+        self.list_atr_models_svi = ['svi-xl']
+        self.list_atr_lora_svi = ['none', 'detail']
+        self.list_atr_lora_flux = ['none', 'realism']
+
+    def image_generate(self, **params):
+        """Sleep for the configured upstream latency and return a noisy PIL image"""
+        time.sleep(self.latency)
+        return make_image(self.image_size, int(params.get('image_seed') or 0))
+
+def make_image(size, seed):
+    """Return a PIL image that compresses like a real generation rather than a flat color"""
+    image = Image.effect_noise((size, size), 64).convert('RGB')
+    return Image.blend(image, Image.new('RGB', (size, size), (seed % 256, 120, 200)), 0.5)
+
+def install_stub(latency, image_size):
+    """Make `import atelier_client` resolve to the stand-in"""
+    StubAtelierClient.latency = latency
+    StubAtelierClient.image_size = image_size
+    module = types.ModuleType('atelier_client')
+    module.AtelierClient = StubAtelierClient
+    sys.modules['atelier_client'] = module
+
+# Seeding ##############################################################
+
+def seed(server, users, history, images, image_size, legacy_ratio):
+    """Create users with large balances and history rows pointing at stored and base64 images"""
+    db = server.sdb
+    urls = []
+    for i in range(images):
+        buffer = BytesIO()
+        make_image(image_size, i).save(buffer, format='WEBP', quality=90)
+        data = buffer.getvalue()
+        urls.append((server.sim.get_url(server.sim.put(data)),
+                     f"data:image/webp;base64,{base64.b64encode(data).decode('utf-8')}"))
+
+    accounts = []
+    now = int(time.time())
+    for i in range(users):
+        username = f'bench{i:04d}'
+        user_id = db.add_user(username, 'benchmark')
+        db.update_user_credits(user_id, 10 ** 6, reason='Benchmark seed')
+        rows = []
+        for j in range(history):
+            stored_url, data_url = random.choice(urls)
+            if j % 5 == 4:
+                rows.append((user_id, 'User Actions', 'Login', 'User logged in', 'success', None, now - j * 600))
+            else:
+                url = data_url if random.random() < legacy_ratio else stored_url
+                rows.append((user_id, 'Image Generator', f'benchmark prompt {j}',
+                             'Style: none | Model: flux-turbo | Size: 1:1 | Seed: 0', 'success', url, now - j * 600))
+        conn = db.get_connection()
+        conn.executemany('''
+            INSERT INTO user_history (user_id, type, task, detail, status, result_url, ts)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+        conn.commit()
+        accounts.append(username)
+    db.release_connection()
+    return accounts
+
+# Virtual Users ########################################################
+
+class VirtualUser:
+    """One logged-in browser session issuing a weighted mix of requests"""
+    scenarios = {
+        'bootstrap': 20,
+        'gallery': 20,
+        'history': 20,
+        'generate': 15,
+        'login': 10,
+        'redeem': 5,
+        'archive': 3
+    }
+
+    def __init__(self, base_url, username, results):
+        """Initialize session with its own cookie jar"""
+        self.base_url = base_url
+        self.username = username
+        self.results = results
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+
+    def request(self, name, path, data=None, json_body=None):
+        """Send request, read the whole body and record its latency under name"""
+        headers = {}
+        body = None
+        if json_body is not None:
+            body = json.dumps(json_body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        elif data is not None:
+            body = urllib.parse.urlencode(data).encode('utf-8')
+        request = urllib.request.Request(self.base_url + path, data=body, headers=headers)
+
+        start = time.perf_counter()
+        try:
+            with self.opener.open(request, timeout=120) as response:
+                status, payload = response.status, response.read()
+        except HTTPError as e:
+            status, payload = e.code, e.read()
+        except Exception:
+            status, payload = 0, b''
+        self.results.record(name, time.perf_counter() - start, status)
+
+        try:
+            return status, json.loads(payload)
+        except ValueError:
+            return status, None
+
+    def login(self):
+        """Log in with the seeded password"""
+        return self.request('login', '/v1/user/login', data={'username': self.username, 'password': 'benchmark'})
+
+    def run_scenario(self, name):
+        """Run one scenario, which may span several requests"""
+        if name == 'bootstrap':
+            self.request('bootstrap', '/v1/bootstrap')
+        elif name == 'gallery':
+            status, page = self.request('gallery', '/v1/user/gallery?limit=30')
+            if page and page.get('next_cursor'):
+                self.request('gallery', f"/v1/user/gallery?limit=30&before={page['next_cursor']}")
+        elif name == 'history':
+            self.request('history', '/v1/user/history?limit=50')
+        elif name == 'generate':
+            self.request('generate', '/v1/atelier/generate', data={
+                'prompt': f'benchmark {random.choice(["cat", "dog", "city", "forest"])}',
+                'image_seed': random.randint(0, 3)
+            })
+        elif name == 'login':
+            self.login()
+        elif name == 'redeem':
+            status, purchase = self.request('purchase', '/v1/credits/purchase', json_body={'bundle_size': 'Small'})
+            if purchase and purchase.get('pin_code'):
+                status, ticket = self.request('redeem', '/v1/credits/redeem', json_body={'pin_code': purchase['pin_code']})
+                if ticket and ticket.get('ticket'):
+                    time.sleep(ticket.get('retry_after', 0))
+                    self.request('redeem_confirm', '/v1/credits/redeem/confirm', json_body={'ticket': ticket['ticket']})
+        elif name == 'archive':
+            status, archive = self.request('archive_create', '/v1/user/archive/create',
+                                           json_body={'current_password': 'benchmark'})
+            if archive and archive.get('download_id'):
+                self.request('archive_download', f"/v1/user/archive/download/{archive['download_id']}")
+
+    def run(self, deadline):
+        """Loop over weighted scenarios until the deadline"""
+        self.login()
+        names, weights = zip(*self.scenarios.items())
+        while time.time() < deadline:
+            self.run_scenario(random.choices(names, weights)[0])
+
+# Results ##############################################################
+
+class Results:
+    """Thread-safe latency and status collector"""
+
+    def __init__(self):
+        """Initialize empty samples"""
+        self._lock = threading.Lock()
+        self.samples = {}
+        self.statuses = {}
+
+    def record(self, name, seconds, status):
+        """Record one request"""
+        with self._lock:
+            self.samples.setdefault(name, []).append(seconds)
+            counts = self.statuses.setdefault(name, {})
+            counts[status] = counts.get(status, 0) + 1
+
+    def percentile(self, values, q):
+        """Nearest-rank percentile of sorted values"""
+        return values[min(len(values) - 1, max(0, int(round(q * len(values))) - 1))]
+
+    def summary(self, duration):
+        """Return {endpoint: stats} with throughput and latency percentiles in milliseconds"""
+        report = {}
+        for name, values in sorted(self.samples.items()):
+            values = sorted(values)
+            report[name] = {
+                'count': len(values),
+                'rps': len(values) / duration,
+                'p50': self.percentile(values, 0.50) * 1000,
+                'p95': self.percentile(values, 0.95) * 1000,
+                'p99': self.percentile(values, 0.99) * 1000,
+                'errors': sum(count for status, count in self.statuses[name].items() if not 200 <= status < 300),
+                'statuses': {str(status): count for status, count in sorted(self.statuses[name].items())}
+            }
+        return report
+
+def peak_rss_mb():
+    """Return peak resident set size of this process and its child processes in MiB"""
+    # ru_maxrss is reported in KiB on Linux and bytes on macOS
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return {
+        'self': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale,
+        'children': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+    }
+
+def print_report(report, rss, baseline=None):
+    """Print endpoint table, optionally with p50/p95/rps change against a saved baseline"""
+    print(f"\n{'endpoint':<18}{'count':>7}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for name, stats in report['endpoints'].items():
+        line = (f"{name:<18}{stats['count']:>7}{stats['rps']:>9.1f}{stats['p50']:>10.1f}"
+                f"{stats['p95']:>10.1f}{stats['p99']:>10.1f}{stats['errors']:>8}")
+        before = (baseline or {}).get('endpoints', {}).get(name)
+        if before:
+            change = lambda key: (stats[key] - before[key]) / before[key] * 100 if before[key] else 0.0
+            line += f"   p50 {change('p50'):+.0f}%  p95 {change('p95'):+.0f}%  rps {change('rps'):+.0f}%"
+        print(line)
+    print(f"\npeak RSS: {rss['self']:.1f} MiB (server + load generator), {rss['children']:.1f} MiB (largest child)")
+
+def main():
+    """Parse arguments, start the app on a local port and run the load"""
+    parser = argparse.ArgumentParser(description='Atelier Benchmark')
+    parser.add_argument('--users', type=int, default=20, help='Seeded users (default: 20)')
+    parser.add_argument('--history', type=int, default=200, help='History rows per user (default: 200)')
+    parser.add_argument('--images', type=int, default=8, help='Distinct seeded images (default: 8)')
+    parser.add_argument('--legacy-ratio', type=float, default=0.3,
+                        help='Share of seeded images kept as base64 data URLs (default: 0.3)')
+    parser.add_argument('--vus', type=int, default=8, help='Concurrent virtual users (default: 8)')
+    parser.add_argument('--duration', type=float, default=30, help='Load duration in seconds (default: 30)')
+    parser.add_argument('--latency', type=float, default=0.5, help='Stub upstream latency in seconds (default: 0.5)')
+    parser.add_argument('--image-size', type=int, default=1024, help='Stub image side in pixels (default: 1024)')
+    parser.add_argument('--rate-limits', action='store_true', help='Keep rate limits on (all users share one address)')
+    parser.add_argument('--workdir', help='Directory for the scratch database and images (default: temporary)')
+    parser.add_argument('--save', help='Write results as JSON to this file')
+    parser.add_argument('--compare', help='Compare against results saved with --save')
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='atelier-benchmark-')
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    sys.path.insert(0, ROOT)
+    install_stub(args.latency, args.image_size)
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    import server
+    from werkzeug.serving import make_server
+    server.app.root_path = ROOT
+    server.limiter.enabled = args.rate_limits
+
+    print(f"Seeding {args.users} users x {args.history} history rows in {workdir}")
+    start = time.perf_counter()
+    accounts = seed(server, args.users, args.history, args.images, args.image_size, args.legacy_ratio)
+    print(f"Seeded in {time.perf_counter() - start:.1f}s")
+
+    httpd = make_server('127.0.0.1', 0, server.app, threaded=True)
+    threading.Thread(target=httpd.serve_forever, name='benchmark-http', daemon=True).start()
+    base_url = f'http://127.0.0.1:{httpd.server_port}'
+
+    print(f"Running {args.vus} virtual users for {args.duration:.0f}s against {base_url}")
+    results = Results()
+    deadline = time.time() + args.duration
+    started = time.perf_counter()
+    users = [VirtualUser(base_url, accounts[i % len(accounts)], results) for i in range(args.vus)]
+    threads = [threading.Thread(target=user.run, args=(deadline,)) for user in users]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    httpd.shutdown()
+    server.sjn.stop()
+    server.sjq.shutdown()
+    server.sie.shutdown()
+
+    report = {
+        'config': vars(args),
+        'duration': elapsed,
+        'endpoints': results.summary(elapsed),
+        'peak_rss_mb': peak_rss_mb()
+    }
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(report, report['peak_rss_mb'], baseline)
+
+    if args.save:
+        with open(os.path.join(ROOT, args.save) if not os.path.isabs(args.save) else args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved results to {args.save}")
+
+if __name__ == '__main__':
+    main()
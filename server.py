@@ -1,36 +1,86 @@
-from flask import Flask, request, jsonify, render_template, redirect, url_for, session, send_file, send_from_directory
+from flask import Flask, Response, g, request, jsonify, render_template, redirect, url_for, session, send_file, send_from_directory, stream_with_context
 from flask_limiter.util import get_remote_address
 from datetime import datetime, timedelta
 from collections import OrderedDict
 from flask_limiter import Limiter
-from threading import Timer
+from itsdangerous import URLSafeTimedSerializer, BadSignature
 from functools import wraps
-from io import BytesIO
 import tempfile
-import zipfile
-import base64
+import atexit
+import hashlib
+import copy
+import json
 import time
 import uuid
 import os
+import re
 
 from atelier_client import AtelierClient
 from utils.database import Database
 from utils.credits import Credits
+from utils.storage import ImageStore
+from utils.imaging import ImageEncoder
+from utils.jobs import JobQueue
+from utils.events import EventBroker
+from utils.archive import ZipStream
+from utils.janitor import Janitor
+from utils.generations import GenerationCache
+from utils.metrics import Metrics
+import utils.ratelimit
 
 app = Flask(__name__)
 app.secret_key = 'xxxxxx'
 
+# Counters live in a SQLite file shared by every worker process (scheme registered by utils.ratelimit)
 limiter = Limiter(
     app=app,
     key_func=get_remote_address,
-    storage_uri="memory://"
+    storage_uri="sqlite:///ratelimit.db",
+    strategy="sliding-window-counter"
     )
 
 app.permanent_session_lifetime = timedelta(hours=1)
 
+smt = Metrics()
+smt.describe('atelier_http_request_duration_seconds', 'histogram', 'Time spent handling requests by route')
+smt.describe('atelier_db_query_duration_seconds', 'histogram', 'Database method call durations')
+smt.describe('atelier_upstream_duration_seconds', 'histogram', 'AtelierClient.image_generate latency')
+smt.describe('atelier_upstream_errors_total', 'counter', 'Failed AtelierClient.image_generate calls')
+smt.describe('atelier_image_encode_duration_seconds', 'histogram', 'WebP encode time including variants')
+smt.describe('atelier_archive_build_duration_seconds', 'histogram', 'Time to stream a gallery archive')
+
 sap = AtelierClient(save_as='pil')
-sdb = Database()
-scr = Credits()
+
+image_variants = {
+    'sm': 384,
+    'md': 1024
+}
+
+sim = ImageStore(variants=image_variants)
+# Set ATELIER_ENCODER_WORKERS to change WebP encoder processes (default: 2, 0 encodes in-thread)
+encoder_workers = os.environ.get('ATELIER_ENCODER_WORKERS')
+# Fork encoder workers before anything below starts threads (e.g. the write-behind writer)
+sie = ImageEncoder(workers=int(encoder_workers) if encoder_workers else None,
+                   variants=image_variants, logger=sap.logger).start()
+
+# Set ATELIER_SLOW_QUERY_MS to log statements at or above that many milliseconds
+slow_query_ms = os.environ.get('ATELIER_SLOW_QUERY_MS')
+# Set ATELIER_WRITE_BEHIND=1 to group-commit history, sign-in and credit writes on one writer thread
+# Set ATELIER_PASSWORD_METHOD (see python -m utils.database --calibrate-hash) to change password hash cost
+sdb = Database(slow_query_ms=float(slow_query_ms) if slow_query_ms else None, logger=sap.logger,
+               write_behind=os.environ.get('ATELIER_WRITE_BEHIND') == '1',
+               password_method=os.environ.get('ATELIER_PASSWORD_METHOD'))
+atexit.register(sdb.stop_writer)
+sdb.init_app(app)
+smt.instrument(sdb, 'atelier_db_query_duration_seconds',
+               skip=('get_connection', 'release_connection', 'init_app', 'pool_stats', 'close', 'get_current_timestamp',
+                     'start_writer', 'stop_writer', 'hash_password', 'needs_rehash',
+                     'invalidate_user', 'cache_stats'))
+scr = Credits(sdb)
+# Opt-in: set ATELIER_GENERATION_CACHE to the number of generations to remember
+sgc = GenerationCache(sim, max_entries=int(os.environ.get('ATELIER_GENERATION_CACHE', 0)))
+seb = EventBroker(sdb)
+sjn = Janitor(sdb)
 
 # Cost Information ###################################################
 
@@ -38,6 +88,11 @@ costs = {
     'atelier': 1
 }
 
+# Redemption attempts are slowed down with signed tickets instead of sleeping on the request thread
+redeem_delay = 1.5
+redeem_ticket_lifetime = 60
+redeem_signer = URLSafeTimedSerializer(app.secret_key, salt='credits-redeem')
+
 menus= OrderedDict([
     ('💰 Topup', "/topup"),
     ('🎨 Generator', "/generator"),
@@ -72,22 +127,162 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+idempotency_ttl = 86400
+idempotency_wait = 120
+idempotency_lease = idempotency_wait
+
+def idempotent(f):
+    """
+    Decorator that replays the stored response for a repeated Idempotency-Key.
+
+    Only successful responses are stored; errors release the key so the
+    client can retry. A duplicate that arrives while the original is still
+    running waits for its response instead of starting new work. In-flight
+    claims only hold a short lease, so a key whose request died with its
+    process can be reused once the lease runs out.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if not key:
+            return f(*args, **kwargs)
+        if len(key) > 255:
+            return jsonify({'success': False, 'error': 'Idempotency-Key is too long'}), 400
+
+        user_id = session['user_id']
+        fingerprint = hashlib.sha256(json.dumps([
+            request.path,
+            sorted(request.form.items(multi=True)),
+            request.get_json(silent=True)
+        ], sort_keys=True).encode('utf-8')).hexdigest()
+
+        existing = sdb.claim_idempotency_key(user_id, key, fingerprint, idempotency_lease)
+        if existing is None:
+            try:
+                response = app.make_response(f(*args, **kwargs))
+            except Exception:
+                sdb.release_idempotency_key(user_id, key)
+                raise
+            if 200 <= response.status_code < 300:
+                sdb.complete_idempotency_key(user_id, key, response.status_code, response.mimetype,
+                                             response.get_data(), idempotency_ttl)
+            else:
+                sdb.release_idempotency_key(user_id, key)
+            return response
+
+        deadline = time.time() + idempotency_wait
+        while existing is not None and existing[1] is None and time.time() < deadline:
+            time.sleep(0.2)
+            existing = sdb.get_idempotency_key(user_id, key)
+
+        if existing is None:
+            # Original failed and released the key; let the client retry with it
+            return jsonify({'success': False, 'error': 'Original request failed. Please retry.'}), 409
+        if existing[0] != fingerprint:
+            return jsonify({'success': False, 'error': 'Idempotency-Key was used with a different request'}), 422
+        if existing[1] is None:
+            response = jsonify({'success': False, 'error': 'Original request is still in progress'})
+            response.status_code = 409
+            response.headers['Retry-After'] = '5'
+            return response
+
+        response = app.response_class(existing[3], status=existing[1], mimetype=existing[2])
+        response.headers['Idempotent-Replayed'] = 'true'
+        return response
+    return decorated_function
+
+# Request Metrics ###################################################
+
+@app.before_request
+def start_request_timer():
+    """Remember when request handling started"""
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_duration(response):
+    """Record request latency under its route pattern"""
+    if 'request_start' in g:
+        smt.observe(
+            'atelier_http_request_duration_seconds',
+            time.perf_counter() - g.request_start,
+            method=request.method,
+            route=request.url_rule.rule if request.url_rule else 'unmatched',
+            status=response.status_code
+        )
+    return response
+
 # Utility Functions ###################################################
 
 def get_current_timestamp():
     """Return current timestamp in dd/mm/yyyy HH:MM:SS format"""
     return datetime.now().strftime('%d/%m/%Y %H:%M:%S')
 
-def increment_user_stats(user_id, feature):
-    """Increment user's generation stats and track credit usage"""
+def reserve_credits(user_id, feature, reason):
+    """Atomically debit the feature cost before running it; returns new balance or None"""
+    balance = sdb.debit_credits(user_id, costs.get(feature.lower(), 1), reason=reason)
+    if balance is not None:
+        seb.publish(user_id, 'credits', {'credits': balance})
+    return balance
+
+def refund_credits(user_id, feature, reason):
+    """Return a reserved feature cost after a failed run"""
     try:
-        # Increment total generations
-        sdb.increment_generations(user_id)
-        # Track credit usage based on feature cost
-        cost = costs.get(feature.lower(), 1)
-        sdb.update_user_credits(user_id, sdb.get_user_credits(user_id) - cost)
+        balance = sdb.refund_credits(user_id, costs.get(feature.lower(), 1), reason=reason)
+        seb.publish(user_id, 'credits', {'credits': balance})
     except Exception as e:
-        print(f"Error updating user stats: {e}")
+        print(f"Error refunding credits: {e}")
+
+def format_timestamp(ts):
+    """Format epoch seconds as dd/mm/yyyy HH:MM:SS for display ('' when unknown)"""
+    return datetime.fromtimestamp(ts).strftime('%d/%m/%Y %H:%M:%S') if ts else ''
+
+def format_rows(rows, ts_index):
+    """Replace the epoch column of each row with its display timestamp"""
+    return [row[:ts_index] + (format_timestamp(row[ts_index]),) + row[ts_index + 1:] for row in rows]
+
+def get_page_args(default_limit=50, max_limit=200):
+    """Parse keyset pagination arguments (limit, before) from the query string"""
+    limit = request.args.get('limit', default_limit, type=int)
+    before = request.args.get('before', None, type=int)
+    return max(1, min(limit or default_limit, max_limit)), before
+
+def add_variant_urls(rows, url_index):
+    """Insert {variant: URL} thumbnails after the result URL column of each row"""
+    return [row[:url_index + 1] + (sim.get_variant_urls(row[url_index]),) + row[url_index + 1:] for row in rows]
+
+def page_response(key, rows, limit, ts_index):
+    """Build paginated JSON response; rows carry their id as the last column"""
+    return jsonify({
+        key: format_rows(rows, ts_index),
+        'next_cursor': rows[-1][-1] if len(rows) == limit else None
+    })
+
+static_payloads = {}
+
+def serialize_static(key, payload):
+    """
+    Return cached {'source', 'body', 'etag'} of rarely-changing JSON.
+
+    The payload is only re-serialized and re-hashed when it no longer equals
+    the cached copy, e.g. after the AtelierClient reloads its presets.
+    """
+    cached = static_payloads.get(key)
+    if cached is None or cached['source'] != payload:
+        body = app.json.dumps(payload).encode('utf-8')
+        cached = static_payloads[key] = {
+            'source': copy.deepcopy(payload),
+            'body': body,
+            'etag': hashlib.sha256(body).hexdigest()[:32]
+        }
+    return cached
+
+def static_json(key, payload):
+    """Serve rarely-changing JSON from pre-serialized bytes with ETag revalidation"""
+    cached = serialize_static(key, payload)
+    response = app.response_class(cached['body'], mimetype='application/json')
+    response.set_etag(cached['etag'])
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
 
 # Web Routes - Favicon & Image Serving #################################
 
@@ -99,6 +294,35 @@ def favicon():
     response.headers['Expires'] = (datetime.now() + timedelta(days=365)).strftime('%a, %d %b %Y %H:%M:%S GMT')
     return response
 
+@app.route('/v1/images/<digest>')
+@login_required
+@limiter.exempt
+def get_image(digest):
+    """Serve stored image by content hash with immutable caching headers"""
+    path = sim.find(digest)
+    if path is None:
+        return 'File not found', 404
+
+    response = send_file(path, mimetype='image/webp', etag=digest, conditional=True)
+    response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
+
+@app.route('/v1/images/<digest>/<variant>')
+@login_required
+@limiter.exempt
+def get_image_variant(digest, variant):
+    """Serve resized image variant, falling back to the original until it is backfilled"""
+    if variant not in image_variants or sim.find(digest) is None:
+        return 'File not found', 404
+
+    path = sim.find(digest, variant)
+    if path is None:
+        return redirect(sim.get_url(digest))
+
+    response = send_file(path, mimetype='image/webp', etag=f'{digest}-{variant}', conditional=True)
+    response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
+
 @app.errorhandler(429)
 def ratelimit_handler(e):
     """Handle rate limit exceeded errors"""
@@ -114,72 +338,91 @@ def ratelimit_handler(e):
 @limiter.exempt
 def get_image_styles():
     """Return available image style presets"""
-    styles = sap.list_atr_styles
-    return jsonify({'styles': styles})
+    return static_json('styles', {'styles': sap.list_atr_styles})
 
 @app.route('/v1/presets/sizes')
 @login_required
 @limiter.exempt
 def get_image_sizes():
     """Return available image size options"""
-    sizes = sap.list_atr_size
-    return jsonify({'sizes': sizes})
+    return static_json('sizes', {'sizes': sap.list_atr_size})
 
 @app.route('/v1/presets/models')
 @login_required
 @limiter.exempt
 def get_generator_models():
     """Return available generator model options"""
-    models = sap.list_atr_models
-    return jsonify({'models': models})
+    return static_json('models', {'models': sap.list_atr_models})
 
 @app.route('/v1/presets/atelier/sizes')
 @login_required
 @limiter.exempt
 def get_atelier_sizes():
     """Return available Atelier size options"""
-    sizes = sap.list_atr_size
-    return jsonify({'sizes': sizes})
+    return static_json('sizes', {'sizes': sap.list_atr_size})
 
 @app.route('/v1/presets/atelier/models')
 @login_required
 @limiter.exempt
 def get_atelier_models():
     """Return available Atelier model options"""
-    models = sap.list_atr_models
-    return jsonify({'models': models})
+    return static_json('models', {'models': sap.list_atr_models})
 
 @app.route('/v1/presets/atelier/models/svi')
 @login_required
 @limiter.exempt
 def get_atelier_models_svi():
     """Return available Atelier model options"""
-    models = sap.list_atr_models_svi
-    return jsonify({'models': models})
+    return static_json('models_svi', {'models': sap.list_atr_models_svi})
 
 @app.route('/v1/presets/atelier/lora/svi')
 @login_required
 @limiter.exempt
 def get_atelier_lora_svi():
     """Return available Atelier LoRA styles"""
-    lora = sap.list_atr_lora_svi
-    return jsonify({'svi_loras': lora})
+    return static_json('lora_svi', {'svi_loras': sap.list_atr_lora_svi})
 
 @app.route('/v1/presets/atelier/lora/flux')
 @login_required
 @limiter.exempt
 def get_atelier_lora_flux():
     """Return available Atelier LoRA styles"""
-    lora = sap.list_atr_lora_flux
-    return jsonify({'flux_loras': lora})
+    return static_json('lora_flux', {'flux_loras': sap.list_atr_lora_flux})
+
+def format_menu_items():
+    """Return numbered menu items and their routes"""
+    return {f"{str(i).zfill(2)}. {k}": v for i, (k, v) in enumerate(menus.items(), 1)}
 
 @app.route('/v1/presets/menu')
 @login_required
 @limiter.exempt
 def get_menu_items():
     """Return numbered menu items and their routes"""
-    return jsonify({'menu_items': {f"{str(i).zfill(2)}. {k}":
-        v for i, (k, v) in enumerate(menus.items(), 1)}})
+    return static_json('menu', {'menu_items': format_menu_items()})
+
+@app.route('/v1/bootstrap')
+@login_required
+@limiter.exempt
+def get_bootstrap():
+    """Return everything a page needs on load: user info plus presets, menu, costs and bundles"""
+    cached = serialize_static('bootstrap', {
+        'menu_items': format_menu_items(),
+        'sizes': sap.list_atr_size,
+        'models': sap.list_atr_models,
+        'styles': sap.list_atr_styles,
+        'svi_loras': sap.list_atr_lora_svi,
+        'flux_loras': sap.list_atr_lora_flux,
+        'costs': costs,
+        'bundles': scr.get_credit_bundles()
+    })
+    user = {'username': session['user'], 'credits': sdb.get_user_credits(session['user_id'])}
+    user_body = app.json.dumps(user).encode('utf-8')
+
+    # Splice the per-user fields onto the pre-serialized static object
+    response = app.response_class(cached['body'][:-1] + b',' + user_body[1:], mimetype='application/json')
+    response.set_etag(hashlib.sha256(cached['etag'].encode('utf-8') + user_body).hexdigest()[:32])
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
 
 # Web Routes - Credit Management #######################################
 
@@ -188,18 +431,19 @@ def get_menu_items():
 @limiter.exempt
 def get_credit_costs():
     """Return credit costs for different operations"""
-    return jsonify(costs)
+    return static_json('costs', costs)
 
 @app.route('/v1/credits/bundles')
 @login_required
 @limiter.exempt
 def get_credit_bundles():
     """Return available credit bundle options"""
-    return jsonify(scr.get_credit_bundles())
+    return static_json('bundles', scr.get_credit_bundles())
 
 @app.route('/v1/credits/purchase', methods=['POST'])
 @login_required
 @limiter.exempt
+@idempotent
 def purchase_credits():
     """Process credit bundle purchase and return PIN code"""
     user_id = session['user_id']
@@ -216,12 +460,41 @@ def purchase_credits():
 @login_required
 @limiter.limit("10 per minute")
 def redeem_pin():
-    """Validate and redeem PIN code for credits"""
-    user_id = session['user_id']
+    """Issue a signed redemption ticket that can be confirmed once redeem_delay has passed"""
     pin_code = request.json.get('pin_code')
-    time.sleep(1.5)
-    
-    success, message = scr.redeem_pin_code(user_id, pin_code)
+    if not pin_code:
+        return jsonify({'success': False, 'message': 'Invalid PIN code'})
+
+    ticket = redeem_signer.dumps({
+        'user_id': session['user_id'],
+        'pin_code': pin_code,
+        'issued': time.time()
+    })
+    response = jsonify({'success': False, 'ticket': ticket, 'retry_after': redeem_delay})
+    response.headers['Retry-After'] = str(int(redeem_delay + 1))
+    return response, 202
+
+@app.route('/v1/credits/redeem/confirm', methods=['POST'])
+@login_required
+@limiter.limit("30 per minute")
+def confirm_redeem_pin():
+    """Redeem PIN code from a ticket issued at least redeem_delay seconds ago"""
+    try:
+        ticket = redeem_signer.loads(request.json.get('ticket') or '', max_age=redeem_ticket_lifetime)
+    except BadSignature:
+        return jsonify({'success': False, 'message': 'Redemption expired. Please try again.'}), 400
+
+    if ticket['user_id'] != session['user_id']:
+        return jsonify({'success': False, 'message': 'Invalid redemption ticket'}), 403
+
+    # Replaces the old time.sleep(): the delay is enforced without holding a worker thread
+    wait = ticket['issued'] + redeem_delay - time.time()
+    if wait > 0:
+        response = jsonify({'success': False, 'retry_after': round(wait, 3)})
+        response.headers['Retry-After'] = str(int(wait + 1))
+        return response, 425
+
+    success, message = scr.redeem_pin_code(session['user_id'], ticket['pin_code'])
     return jsonify({'success': success, 'message': message})
 
 # Web Routes - User Stats #############################################
@@ -289,16 +562,35 @@ def get_user_info(username):
 @login_required
 @limiter.exempt
 def get_current_user_history():
-    """Return complete history of current user's activities"""
-    history = sdb.get_user_history(session['user_id'])
+    """Return one page of current user's activities, newest first"""
+    limit, before = get_page_args()
+    history = sdb.get_user_history(session['user_id'], limit, before)
     
-    return jsonify({'history': history})
+    return page_response('history', history, limit, ts_index=4)
+
+@app.route('/v1/user/history/sync')
+@login_required
+@limiter.exempt
+def sync_current_user_history():
+    """Return current user's activities newer than the after id, or the first page and total count without one"""
+    limit, _ = get_page_args()
+    after = request.args.get('after', None, type=int)
+    include_urls = request.args.get('urls', 0, type=int) == 1
+    history, total, latest_id, reset = sdb.sync_user_history(session['user_id'], after, limit, include_urls)
+
+    return jsonify({
+        'history': format_rows(history, ts_index=4),
+        'total': total,
+        'latest_id': latest_id,
+        'reset': reset,
+        'next_cursor': history[-1][-1] if after is None and len(history) == limit else None
+    })
 
 @app.route('/v1/user/history/<username>')
 @login_required
 @limiter.exempt
 def get_user_history(username):
-    """Return complete history of specific user's activities"""
+    """Return one page of specific user's activities, newest first"""
     if username == session['user']:
         return jsonify({'message': 'Not applicable'}), 400
 
@@ -306,9 +598,10 @@ def get_user_history(username):
     if user_id is None:
         return jsonify({'message': 'User not found'}), 404
 
-    history = sdb.get_user_history(user_id)
+    limit, before = get_page_args()
+    history = sdb.get_user_history(user_id, limit, before)
     
-    return jsonify({'history': history})
+    return page_response('history', history, limit, ts_index=4)
 
 # Web Routes - Gallery ##################################################
 
@@ -316,16 +609,17 @@ def get_user_history(username):
 @login_required
 @limiter.exempt
 def get_current_user_gallery():
-    """Return gallery of current user with image URLs"""
-    gallery = sdb.get_user_gallery(session['user_id'])
+    """Return one page of current user's gallery with image URLs"""
+    limit, before = get_page_args()
+    gallery = sdb.get_user_gallery(session['user_id'], limit, before)
     
-    return jsonify({'gallery': gallery})
+    return page_response('gallery', add_variant_urls(gallery, url_index=4), limit, ts_index=3)
 
 @app.route('/v1/user/gallery/<username>')
 @login_required
 @limiter.exempt
 def get_user_gallery(username):
-    """Return gallery of specific user with image URLs"""
+    """Return one page of specific user's gallery with image URLs"""
     if username == session['user']:
         return jsonify({'message': 'Not applicable'}), 400
         
@@ -334,8 +628,9 @@ def get_user_gallery(username):
     if user_id is None:
         return jsonify({'message': 'User not found'}), 404
 
-    gallery = sdb.get_user_gallery(user_id)
-    return jsonify({'gallery': gallery})
+    limit, before = get_page_args()
+    gallery = sdb.get_user_gallery(user_id, limit, before)
+    return page_response('gallery', add_variant_urls(gallery, url_index=4), limit, ts_index=3)
 
 # Web Routes - Username Management #######################################
 
@@ -421,8 +716,7 @@ def clear_history():
             type='User Actions',
             task='Clear History',
             detail='All previous user history has been deleted',
-            status='success',
-            timestamp=get_current_timestamp()
+            status='success'
         )
         return jsonify({
             'success': True,
@@ -436,10 +730,34 @@ def clear_history():
 
 # Web Routes - Archive #################################################
 
+archive_lifetime = 600  # Download links stay valid for 10 minutes
+
+def iter_archive_files(user_id):
+    """Yield (filename, image bytes) for user's gallery one image at a time"""
+    for ts, result_url, history_id in sdb.iter_user_gallery(user_id):
+        try:
+            # Load raw bytes from the image store or a legacy data URL
+            image_data = sim.load(result_url)
+            if image_data is None:
+                continue
+            yield f"{datetime.fromtimestamp(ts).strftime('%d-%m-%Y_%H-%M-%S')}_{history_id}.webp", image_data
+        
+        except Exception as e:
+            print(f"Error processing image: {e}")
+            continue
+
+def sweep_legacy_archives(max_age=archive_lifetime):
+    """Remove ZIP files written to the temp directory by earlier archive exports"""
+    pattern = re.compile(r'^.+_[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}_\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2}\.zip$')
+    cutoff = time.time() - max_age
+    for entry in os.scandir(tempfile.gettempdir()):
+        if pattern.match(entry.name) and entry.stat().st_mtime < cutoff:
+            os.remove(entry.path)
+
 @app.route('/v1/user/archive/create', methods=['POST'])
 @login_required
 def create_archive():
-    """Create ZIP archive of user's gallery base64 images"""
+    """Authorize a streamed ZIP download of user's gallery images"""
     user_id = session['user_id']
     password = request.json.get('current_password')
     
@@ -450,41 +768,16 @@ def create_archive():
         })
     
     download_id = f"{session['user']}_{str(uuid.uuid4())}_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}"
-    zip_path = os.path.join(tempfile.gettempdir(), f'{download_id}.zip')
-    
-    gallery = sdb.get_user_gallery(user_id)
-    
-    with zipfile.ZipFile(zip_path, 'w') as zipf:
-        for _, _, _, timestamp, result_url in gallery:
-            if result_url and result_url.startswith('data:image'):
-                try:
-                    # Extract the base64 data after the comma
-                    base64_data = result_url.split(',')[1]
-                    # Decode base64 to binary
-                    image_data = base64.b64decode(base64_data)
-                    filename = f"{timestamp.replace('/', '-').replace(':', '-').replace(' ', '_')}.webp"
-                    # Write binary data directly to zip
-                    zipf.writestr(filename, image_data)
-                
-                except Exception as e:
-                    print(f"Error processing image: {e}")
-                    continue
+    session['archive_download'] = {'id': download_id, 'expires': time.time() + archive_lifetime}
     
     sdb.add_user_history(
         user_id=user_id,
         type='User Actions',
         task='Archive Download',
-        detail=f'User downloaded their archive of {len(gallery)} generations',
-        status='success',
-        timestamp=get_current_timestamp()
+        detail=f'User downloaded their archive of {sdb.count_user_gallery(user_id)} generations',
+        status='success'
     )
     
-    def delete_zip():
-        if os.path.exists(zip_path):
-            os.remove(zip_path)
-            
-    Timer(600, delete_zip).start()  # Delete after 10 minutes
-    
     return jsonify({
         'success': True,
         'download_id': download_id,
@@ -494,14 +787,22 @@ def create_archive():
 @app.route('/v1/user/archive/download/<download_id>')
 @login_required
 def download_archive_file(download_id):
-    """Serve created ZIP archive for download"""
-    zip_path = os.path.join(tempfile.gettempdir(), f'{download_id}.zip')
+    """Stream ZIP archive of user's gallery straight from the database"""
+    archive = session.get('archive_download')
     
-    if os.path.exists(zip_path):
-        download_name = f'{session["user"]}_{datetime.now().strftime("%Y-%m-%d_%H-%M-%S")}_gallery.zip'
-        return send_file(zip_path, as_attachment=True, download_name=download_name)
+    if not archive or archive['id'] != download_id or archive['expires'] < time.time():
+        return 'File not found', 404
     
-    return 'File not found', 404
+    download_name = f'{session["user"]}_{datetime.now().strftime("%Y-%m-%d_%H-%M-%S")}_gallery.zip'
+    response = Response(
+        stream_with_context(smt.timed_iter(
+            'atelier_archive_build_duration_seconds',
+            ZipStream().generate(iter_archive_files(session['user_id']))
+        )),
+        mimetype='application/zip'
+    )
+    response.headers['Content-Disposition'] = f'attachment; filename="{download_name}"'
+    return response
 
 # Web Routes - Authentication/Password Management #######################
 
@@ -528,8 +829,7 @@ def update_password():
             type='User Actions',
             task='Password Changed',
             detail='User changed their password',
-            status='success',
-            timestamp=get_current_timestamp()
+            status='success'
         )
         return jsonify({
             'success': True,
@@ -558,8 +858,7 @@ def reset_password():
                 type='User Actions',
                 task='Password Reset',
                 detail='User has reset their password',
-                status='success',
-                timestamp=get_current_timestamp()
+                status='success'
             )
             
             return jsonify({
@@ -596,27 +895,15 @@ def login():
     if request.method == 'POST':
         username = request.form['username']
         password = request.form['password']
-        user_id = sdb.check_user(username, password)
+        # Verifies the password, stamps last signin and logs the login in one transaction
+        user_id = sdb.login_user(username, password)
         
         if user_id:
-            # Update last signin time
-            sdb.update_last_signin(user_id)
-            
             session.permanent = True  # Enable session expiration
             session['user'] = username
             session['user_id'] = user_id
             session['last_activity'] = datetime.now().isoformat()
             
-            # Add to history
-            sdb.add_user_history(
-                user_id=user_id,
-                type='User Actions',
-                task='Login',
-                detail='User logged in',
-                status='success',
-                timestamp=get_current_timestamp()
-            )
-            
             return jsonify({
                 'success': True,
                 'redirect': url_for('generator')
@@ -664,26 +951,25 @@ def logout():
 
 # Web Routes - Image Processing ###########################################
 
-def __data_url_processor(pil_image) -> str:
-    """Convert PIL Image to base64 data URL."""
+def __image_url_processor(pil_image) -> str:
+    """Encode PIL Image as WebP on the encoder pool, store it and return its image URL."""
     try:
-        img_io = BytesIO()
-        pil_image.save(img_io, format='WEBP', quality=90)
-        img_io.seek(0)
-        img_base64 = base64.b64encode(img_io.getvalue()).decode()
+        with smt.timer('atelier_image_encode_duration_seconds'):
+            outputs = sie.encode(pil_image)
+        digest = sim.put(outputs['original'])
+        for variant in image_variants:
+            sim.put_variant(digest, variant, outputs[variant])
         
-        sap.logger.info(f"Created data URL from PIL object!")
-        return f"data:image/png;base64,{img_base64}"
+        sap.logger.info(f"Stored image {digest} from PIL object!")
+        return sim.get_url(digest)
     
     except Exception as e:
-        sap.logger.error(f"Error in data_url_processor: {e}")
+        sap.logger.error(f"Error in image_url_processor: {e}")
         return None
 
-@app.route('/v1/atelier/generate', methods=['POST'])
-@login_required
-def generate_atelier(feature='Image Generator'):
+def get_generation_params():
     """
-    Handle image generation requests via form data.
+    Read image generation parameters from form data.
 
     Form Parameters:
     - prompt (str, required): User's positive prompt
@@ -695,58 +981,197 @@ def generate_atelier(feature='Image Generator'):
     - image_seed (int, optional): Seed for image generation (default: 0)
     - style_name (str, optional): Name of the style preset (default: "none")
     """
+    return {
+        'prompt': request.form.get('prompt'),
+        'negative_prompt': request.form.get('negative_prompt', ''),
+        'model_name': request.form.get('model_name', 'flux-turbo'),
+        'image_size': request.form.get('image_size', '1:1'),
+        'lora_svi': request.form.get('lora_svi', 'none'),
+        'lora_flux': request.form.get('lora_flux', 'none'),
+        'image_seed': request.form.get('image_seed', 0),
+        'style_name': request.form.get('style_name', 'none')
+    }
+
+def generate_image_url(data):
+    """Call the upstream generator and store its image; returns image URL"""
     try:
-        user_id = session['user_id']
-        
-        data = {
-            'prompt': request.form.get('prompt'),
-            'negative_prompt': request.form.get('negative_prompt', ''),
-            'model_name': request.form.get('model_name', 'flux-turbo'),
-            'image_size': request.form.get('image_size', '1:1'),
-            'lora_svi': request.form.get('lora_svi', 'none'),
-            'lora_flux': request.form.get('lora_flux', 'none'),
-            'image_seed': request.form.get('image_seed', 0),
-            'style_name': request.form.get('style_name', 'none')
-        }
-        
-        task = data['prompt']
-        detail = f"Style: {data['style_name']} | Model: {data['model_name']} | Size: {data['image_size']} | Seed: {data['image_seed']}"
-
-        if not data['prompt']:
-            raise Exception("Missing prompt")
-
-        result = sap.image_generate(**data)
+        with smt.timer('atelier_upstream_duration_seconds'):
+            result = sap.image_generate(**data)
         if not result:
             raise Exception("Generation failed")
+    except Exception:
+        smt.inc('atelier_upstream_errors_total')
+        raise
+    return __image_url_processor(result)
+
+def run_generation(user_id, data, feature='Image Generator', job_id=None):
+    """Generate image, record it in user history and charge credits; safe to run off the request thread"""
+    task = data['prompt']
+    detail = f"Style: {data['style_name']} | Model: {data['model_name']} | Size: {data['image_size']} | Seed: {data['image_seed']}"
+
+    if not data['prompt']:
+        raise Exception("Missing prompt")
+
+    # Reserve credits up front so concurrent generations can't overdraw the balance
+    balance = reserve_credits(user_id, 'atelier', reason=feature)
+    if balance is None:
+        raise Exception("Insufficient credits")
+    if job_id is not None:
+        # Lets another process refund the reservation if this one dies mid-job
+        sdb.set_job_charged(job_id, costs.get('atelier', 1))
 
-        data_url = __data_url_processor(result)
-        if not data_url:
+    try:
+        # Identical deterministic requests share one upstream call and its stored image
+        image_url = sgc.get_or_generate(data, generate_image_url)
+        if not image_url:
             raise Exception("Failed to process image")
-        
-        sdb.add_user_history(
-            user_id=user_id, 
-            type=feature, 
-            task=task, 
-            detail=detail,
-            status='success', 
-            timestamp=get_current_timestamp(), 
-            result_url=data_url
-        )
-        
-        increment_user_stats(user_id, 'atelier')
+    except Exception:
+        refund_credits(user_id, 'atelier', reason=f'{feature} refund')
+        if job_id is not None:
+            sdb.set_job_charged(job_id, 0)
+        raise
+    
+    sdb.add_user_history(
+        user_id=user_id, 
+        type=feature, 
+        task=task, 
+        detail=detail,
+        status='success',
+        result_url=image_url
+    )
+    
+    sdb.increment_generations(user_id)
+
+    return {
+        "result": image_url,
+        "credits": balance,
+        "timestamp": get_current_timestamp(),
+        "seed": data['image_seed']
+    }
+
+def refund_abandoned_job(user_id, amount):
+    """Return credits reserved by a job whose process died before finishing it"""
+    balance = sdb.refund_credits(user_id, amount, reason='Image Generator refund (interrupted)')
+    seb.publish(user_id, 'credits', {'credits': balance})
+
+sjq = JobQueue(sdb, run_generation, logger=sap.logger, refund=refund_abandoned_job)
+sjq.recover()
+
+smt.gauge('atelier_job_queue_depth', sjq.depth, 'Generation jobs queued or running in this process')
+smt.gauge('atelier_event_subscribers', seb.subscriber_count, 'Open live event streams')
+smt.gauge('atelier_db_pool_idle_connections', lambda: sdb.pool_stats()['idle'], 'Idle pooled database connections')
+smt.callback_counter('atelier_db_row_cache_hits_total', lambda: sdb.cache_stats()['hits'],
+                     'Username, credit and stats lookups served from memory')
+smt.callback_counter('atelier_db_row_cache_misses_total', lambda: sdb.cache_stats()['misses'],
+                     'Username, credit and stats lookups that queried SQLite')
+smt.gauge('atelier_db_write_queue_depth', lambda: sdb.pool_stats()['write_queue'], 'Writes waiting for the database writer thread')
+
+# Background Maintenance #################################################
+
+def backfill_image_variants():
+    """Generate thumbnails for images stored before variants existed, a batch per run"""
+    if sim.backfill_variants(sie) is None:
+        sjn.cancel('image_variants')
+
+sjn.schedule('archives', 300, sweep_legacy_archives)
+sjn.schedule('image_temp_files', 3600, sim.sweep_temp_files)
+sjn.schedule('events', 60, seb.prune)
+sjn.schedule('jobs', 3600, sjq.prune)
+sjn.schedule('job_heartbeat', 30, sjq.heartbeat)
+sjn.schedule('job_recovery', 60, sjq.recover)
+sjn.schedule('pin_codes', 3600, scr.sweep_pin_codes)
+sjn.schedule('idempotency_keys', 3600, sdb.prune_idempotency_keys)
+sjn.schedule('image_variants', 10, backfill_image_variants)
+sjn.start()
 
-        return jsonify({
-            "success": True, 
-            "result": data_url,
-            "credits": sdb.get_user_credits(user_id),
-            "timestamp": get_current_timestamp(),
-            "seed": data['image_seed']
-        })
+@app.route('/v1/atelier/generate', methods=['POST'])
+@login_required
+@idempotent
+def generate_atelier():
+    """Handle image generation requests synchronously (see get_generation_params for form data)"""
+    try:
+        result = run_generation(session['user_id'], get_generation_params())
+        return jsonify({"success": True, **result})
 
     except Exception as e:
         sap.logger.error(f"Error in image_generate_api: {e}")
         return jsonify({"success": False, "error": str(e)}), 400
 
+# Web Routes - Generation Jobs ###########################################
+
+@app.route('/v1/atelier/jobs', methods=['POST'])
+@login_required
+@idempotent
+def submit_atelier_job():
+    """Queue image generation job (see get_generation_params for form data) and return its ID"""
+    data = get_generation_params()
+    if not data['prompt']:
+        return jsonify({"success": False, "error": "Missing prompt"}), 400
+
+    job_id, reason = sjq.submit(session['user_id'], data)
+    if job_id is None:
+        if reason == 'user_limit':
+            response = jsonify({"success": False, "error": "Too many generations in progress. Please wait."})
+            response.status_code = 429
+        else:
+            response = jsonify({"success": False, "error": "Generator is busy. Please try again shortly."})
+            response.status_code = 503
+        response.headers['Retry-After'] = str(sjq.retry_after)
+        return response
+
+    return jsonify({"success": True, "job_id": job_id, "status": "queued"}), 202
+
+@app.route('/v1/atelier/jobs/<job_id>')
+@login_required
+@limiter.exempt
+def get_atelier_job(job_id):
+    """Return current status of a generation job"""
+    job = sjq.get(job_id, session['user_id'])
+    if job is None:
+        return jsonify({"success": False, "error": "Job not found"}), 404
+
+    return jsonify({
+        "success": True,
+        "job_id": job['job_id'],
+        "status": job['status'],
+        "error": job['error']
+    })
+
+@app.route('/v1/atelier/jobs/<job_id>/result')
+@login_required
+@limiter.exempt
+def get_atelier_job_result(job_id):
+    """Return result of a finished generation job"""
+    job = sjq.get(job_id, session['user_id'])
+    if job is None:
+        return jsonify({"success": False, "error": "Job not found"}), 404
+
+    if job['status'] == 'done':
+        return jsonify({"success": True, **job['result']})
+    if job['status'] == 'failed':
+        return jsonify({"success": False, "error": job['error']}), 400
+
+    response = jsonify({"success": False, "status": job['status']})
+    response.status_code = 202
+    response.headers['Retry-After'] = '1'
+    return response
+
+# Web Routes - Live Events #############################################
+
+@app.route('/v1/events')
+@login_required
+@limiter.exempt
+def stream_events():
+    """Stream job state and credit balance changes as server-sent events"""
+    last_event_id = request.headers.get('Last-Event-ID', None, type=int)
+    response = Response(
+        stream_with_context(seb.stream(session['user_id'], last_event_id)),
+        mimetype='text/event-stream'
+    )
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 # Web Routes - Page Rendering ###########################################
 
 @app.route('/')
@@ -757,9 +1182,16 @@ def index():
     return render_template('index.html')
 
 @app.route('/status')
+@limiter.exempt
 def status():
-    """Render status page"""
-    return render_template('status.html')
+    """Render status page with live metric summaries"""
+    return render_template('status.html', metrics=smt.summary())
+
+@app.route('/metrics')
+@limiter.exempt
+def metrics():
+    """Expose metrics in Prometheus text exposition format"""
+    return Response(smt.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/history')
 @login_required
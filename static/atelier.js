@@ -14,6 +14,115 @@ function clearSessionStorage() {
   sessionStorage.clear();
 }
 
+// Unique key per action so a retried request is only processed once
+function newIdempotencyKey() {
+  return window.crypto && crypto.randomUUID
+    ? crypto.randomUUID()
+    : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+}
+
+// Send a request, retrying network failures and in-progress replies with the same
+// key so the server processes the action once
+async function fetchIdempotent(url, options, key, attempts = 3) {
+  for (let attempt = 1; ; attempt++) {
+    try {
+      const response = await fetch(url, { ...options, headers: { ...options.headers, 'Idempotency-Key': key } });
+      const retryAfter = response.headers.get('Retry-After');
+      if (response.status !== 409 || !retryAfter || attempt >= attempts) return response;
+      await new Promise(resolve => setTimeout(resolve, parseInt(retryAfter, 10) * 1000));
+    } catch (error) {
+      if (attempt >= attempts) throw error;
+      await new Promise(resolve => setTimeout(resolve, attempt * 1000));
+    }
+  }
+}
+
+// Pending job callbacks resolved by the live event stream
+const jobWaiters = {};
+let liveEvents = null;
+
+// Subscribe to job state and credit balance events while the page is visible;
+// pending jobs fall back to polling while the stream is closed.
+// Returns a function that unsubscribes.
+function connectLiveEvents(onCredits) {
+  const connect = () => {
+    liveEvents = new EventSource('/v1/events');
+    liveEvents.addEventListener('credits', (e) => onCredits(JSON.parse(e.data).credits));
+    liveEvents.addEventListener('job', (e) => {
+      const job = JSON.parse(e.data);
+      if (jobWaiters[job.job_id] && (job.status === 'done' || job.status === 'failed')) {
+        jobWaiters[job.job_id](job);
+      }
+    });
+  };
+  const disconnect = () => {
+    if (liveEvents) liveEvents.close();
+    liveEvents = null;
+  };
+  const onVisibilityChange = () => {
+    if (document.hidden) disconnect();
+    else if (!liveEvents) connect();
+  };
+
+  if (!document.hidden) connect();
+  document.addEventListener('visibilitychange', onVisibilityChange);
+  return () => {
+    document.removeEventListener('visibilitychange', onVisibilityChange);
+    disconnect();
+  };
+}
+
+// Give up on a job after this long; the server fails and refunds jobs its workers abandon
+const jobTimeout = 5 * 60 * 1000;
+
+// Wait for a queued generation job to finish and return its result;
+// polling is only a fallback while the event stream is disconnected
+function waitForJob(jobId) {
+  return new Promise((resolve, reject) => {
+    let timer = null;
+    let deadline = null;
+
+    const finish = (job) => {
+      delete jobWaiters[jobId];
+      clearTimeout(timer);
+      clearTimeout(deadline);
+      if (job.status === 'done') {
+        resolve({ success: true, ...job.result });
+      } else {
+        reject(new Error(job.error || 'Image generation failed'));
+      }
+    };
+
+    const pollDelay = () => (liveEvents && liveEvents.readyState === EventSource.OPEN ? 5000 : 1000);
+
+    const poll = async () => {
+      try {
+        const response = await fetch(`/v1/atelier/jobs/${jobId}/result`);
+        const data = await response.json();
+        if (!jobWaiters[jobId]) return;
+        if (response.status !== 202) {
+          if (response.ok) {
+            finish({ status: 'done', result: data });
+          } else {
+            finish({ status: 'failed', error: data.error || `HTTP error! status: ${response.status}` });
+          }
+          return;
+        }
+      } catch (error) {
+        console.error('Error polling job:', error);
+      }
+      timer = setTimeout(poll, pollDelay());
+    };
+
+    jobWaiters[jobId] = finish;
+    timer = setTimeout(poll, pollDelay());
+    deadline = setTimeout(
+      () => finish({ status: 'failed', error: 'Image generation timed out. Please check your history before retrying.' }),
+      jobTimeout
+    );
+  });
+}
+
 function handleLogout() {
   fetch('/v1/user/logout', {
     method: 'GET',
@@ -90,6 +199,10 @@ function ImageGallery({ images, onDownload, onEnlarge }) {
     if (url.startsWith('data:image')) {
       return url;
     }
+    // Image store references are already same-origin paths
+    if (url.startsWith('/')) {
+      return url;
+    }
     // For regular URLs, get the pathname
     try {
       return new URL(url).pathname;
@@ -428,58 +541,22 @@ function Generator() {
   };
 
   useEffect(() => {
-    fetch('/v1/user/info')
+    fetch('/v1/bootstrap')
       .then(response => response.json())
       .then(data => {
         setUsername(data.username);
         setCredits(data.credits);
-      })
-      .catch(error => console.error('Error fetching user info:', error));
-
-    fetch('/v1/presets/menu')
-      .then(response => response.json())
-      .then(data => setMenuItems(data.menu_items))
-      .catch(error => console.error('Error fetching menu items:', error));
-
-    fetch('/v1/presets/atelier/sizes')
-      .then(response => response.json())
-      .then(data => setSizeOptions(data.sizes))
-      .catch(error => console.error('Error fetching sizes:', error));
-
-    fetch('/v1/presets/atelier/models')
-      .then(response => response.json())
-      .then(data => setModelOptions(data.models))
-      .catch(error => console.error('Error fetching models:', error));
-
-    fetch('/v1/presets/styles')
-      .then(response => response.json())
-      .then(data => setStyleOptions(data.styles))
-      .catch(error => console.error('Error fetching styles:', error));
-
-    fetch('/v1/credits/costs')
-      .then(response => response.json())
-      .then(data => setCosts(data))
-      .catch(error => console.error('Error fetching costs:', error));
-
-    fetch('/v1/presets/atelier/lora/svi')
-      .then(response => response.json())
-      .then(data => {
-        const options = Array.isArray(data.svi_loras) ? data.svi_loras : [];
-        setSviLoraOptions(options);
+        setMenuItems(data.menu_items);
+        setSizeOptions(data.sizes);
+        setModelOptions(data.models);
+        setStyleOptions(data.styles);
+        setCosts(data.costs);
+        setSviLoraOptions(Array.isArray(data.svi_loras) ? data.svi_loras : []);
+        setFluxLoraOptions(Array.isArray(data.flux_loras) ? data.flux_loras : []);
       })
       .catch(error => {
-        console.error('Error fetching SVI loras:', error);
+        console.error('Error fetching bootstrap data:', error);
         setSviLoraOptions([]);
-      });
-
-    fetch('/v1/presets/atelier/lora/flux')
-      .then(response => response.json())
-      .then(data => {
-        const options = Array.isArray(data.flux_loras) ? data.flux_loras : [];
-        setFluxLoraOptions(options);
-      })
-      .catch(error => {
-        console.error('Error fetching Flux loras:', error);
         setFluxLoraOptions([]);
       });
 
@@ -490,10 +567,12 @@ function Generator() {
     }
 
     document.addEventListener("mousedown", handleClickOutside);
+    const disconnectLiveEvents = connectLiveEvents(setCredits);
     setIsLoading(false);
 
     return () => {
       document.removeEventListener("mousedown", handleClickOutside);
+      disconnectLiveEvents();
     };
   }, []);
 
@@ -570,21 +649,21 @@ function Generator() {
     let newImages = [...images];
 
     try {
-        const response = await fetch('/v1/user/info');
-        const data = await response.json();
+        // Credit balance is kept current by the live event stream
         const costPerImage = costs && costs.atelier;
         const totalCost = costPerImage * quantity;
         
-        if (data.credits < totalCost) {
-            const neededCredits = totalCost - data.credits;
+        if (credits < totalCost) {
+            const neededCredits = totalCost - credits;
             throw new Error(
-              `Insufficient credits. You need ${totalCost} credits but only have ${data.credits}.\n` +
+              `Insufficient credits. You need ${totalCost} credits but only have ${credits}.\n` +
               `You need ${neededCredits} more credits to generate ${quantity} image${quantity > 1 ? 's' : ''}.\n` +
               `Visit the Topup page to purchase more credits.`
             );
         }
 
         const generateSingleImage = async (index) => {
+            const idempotencyKey = newIdempotencyKey();
             try {
                 const formData = new FormData();
                 formData.append('prompt', prompt.trim());
@@ -597,17 +676,18 @@ function Generator() {
                 formData.append('quantity', quantity);
                 if (seed.trim()) formData.append('image_seed', seed.trim());
 
-                const response = await fetch('/v1/atelier/generate', {
+                const response = await fetchIdempotent('/v1/atelier/jobs', {
                     method: 'POST',
                     body: formData
-                });
+                }, idempotencyKey);
 
                 if (!response.ok) {
                     const errorData = await response.json();
                     throw new Error(errorData.error || `HTTP error! status: ${response.status}`);
                 }
 
-                const data = await response.json();
+                const job = await response.json();
+                const data = await waitForJob(job.job_id);
                 
                 if (data.success && data.result) {
                     const newImage = {
@@ -57,7 +57,9 @@ function ImageGallery({ images, onDownload, onEnlarge }) {
       {images.map((image, index) => (
         <div key={index} className="image-container">
           <img
-            src={image[4]}
+            src={image[5] ? image[5].sm : image[4]}
+            srcSet={image[5] ? `${image[5].sm} 384w, ${image[5].md} 1024w` : undefined}
+            sizes="300px"
             className="thumbnail"
             alt={`Image ${index + 1}`}
             loading="lazy"
@@ -317,30 +319,28 @@ function Gallery() {
   const [uniqueTypes, setUniqueTypes] = useState([]);
   const [showScrollTop, setShowScrollTop] = useState(false);
   const [typeCounts, setTypeCounts] = useState({});
+  const [nextCursor, setNextCursor] = useState(null);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
+  const loadMoreRef = useRef(null);
+  const fetchLimit = 30;
+
+  // Fetch one page of gallery images older than the given cursor
+  const fetchGalleryPage = (cursor) => {
+    const params = new URLSearchParams({ limit: fetchLimit });
+    if (cursor !== null) params.append('before', cursor);
+    return fetch(`/v1/user/gallery?${params}`).then(res => res.json());
+  };
 
   useEffect(() => {
     Promise.all([
-      fetch('/v1/user/info').then(res => res.json()),
-      fetch('/v1/presets/menu').then(res => res.json()),
-      fetch('/v1/user/gallery').then(res => res.json())
-    ]).then(([userInfo, menuItems, gallery]) => {
-      setUsername(userInfo.username);
-      setCredits(userInfo.credits);
-      setMenuItems(menuItems.menu_items);
+      fetch('/v1/bootstrap').then(res => res.json()),
+      fetchGalleryPage(null)
+    ]).then(([bootstrap, gallery]) => {
+      setUsername(bootstrap.username);
+      setCredits(bootstrap.credits);
+      setMenuItems(bootstrap.menu_items);
       setImages(gallery.gallery);
-      
-      // Extract unique types and count occurrences
-      const types = [...new Set(gallery.gallery.map(img => img[0]))];
-      setUniqueTypes(types);
-      
-      // Calculate counts for each type
-      const counts = gallery.gallery.reduce((acc, img) => {
-        acc[img[0]] = (acc[img[0]] || 0) + 1;
-        return acc;
-      }, {});
-      counts.all = gallery.gallery.length; // Add total count
-      setTypeCounts(counts);
-      
+      setNextCursor(gallery.next_cursor);
       setIsLoading(false);
     }).catch(error => {
       console.error('Error fetching data:', error);
@@ -357,6 +357,40 @@ function Gallery() {
     return () => document.removeEventListener("mousedown", handleClickOutside);
   }, []);
 
+  // Extract unique types and count occurrences across loaded images
+  useEffect(() => {
+    const types = [...new Set(images.map(img => img[0]))];
+    setUniqueTypes(types);
+    
+    const counts = images.reduce((acc, img) => {
+      acc[img[0]] = (acc[img[0]] || 0) + 1;
+      return acc;
+    }, {});
+    counts.all = images.length; // Add total count
+    setTypeCounts(counts);
+  }, [images]);
+
+  // Fetch the next page when the end of the gallery scrolls into view
+  useEffect(() => {
+    if (isLoading || isLoadingMore || nextCursor === null || !loadMoreRef.current) return;
+
+    const observer = new IntersectionObserver((entries) => {
+      if (!entries[0].isIntersecting) return;
+      observer.disconnect();
+      setIsLoadingMore(true);
+      fetchGalleryPage(nextCursor)
+        .then(gallery => {
+          setImages(prev => [...prev, ...gallery.gallery]);
+          setNextCursor(gallery.next_cursor);
+        })
+        .catch(error => console.error('Error fetching more images:', error))
+        .finally(() => setIsLoadingMore(false));
+    }, { rootMargin: '400px' });
+
+    observer.observe(loadMoreRef.current);
+    return () => observer.disconnect();
+  }, [isLoading, isLoadingMore, nextCursor]);
+
   // Sort and filter images
   useEffect(() => {
     let sorted = [...images];
@@ -375,7 +409,8 @@ function Gallery() {
           const dateTimeA = new Date(`${yearA}-${monthA}-${dayA} ${timeA}`);
           const dateTimeB = new Date(`${yearB}-${monthB}-${dayB} ${timeB}`);
           
-          return dateTimeB - dateTimeA;
+          // Images without a known date ('') sort as the oldest
+          return (dateTimeB.getTime() || 0) - (dateTimeA.getTime() || 0);
         });
         break;
       case 'date-asc':
@@ -390,7 +425,8 @@ function Gallery() {
           const dateTimeA = new Date(`${yearA}-${monthA}-${dayA} ${timeA}`);
           const dateTimeB = new Date(`${yearB}-${monthB}-${dayB} ${timeB}`);
           
-          return dateTimeA - dateTimeB;
+          // Images without a known date ('') sort as the oldest
+          return (dateTimeA.getTime() || 0) - (dateTimeB.getTime() || 0);
         });
         break;
       case 'type':
@@ -496,6 +532,8 @@ function Gallery() {
           <p className="no-gallery">Nothing to see here.</p>
         )}
 
+        {nextCursor !== null && <div ref={loadMoreRef} className="gallery-load-more" />}
+
         {enlargedImageIndex !== null && (
           <EnlargedImage
             image={filteredImages[enlargedImageIndex]}
@@ -71,6 +71,60 @@ const getColumnIndex = (key) => {
   return indices[key];
 };
 
+const sortRows = (rows, key, direction) => {
+  return [...rows].sort((a, b) => {
+    let aValue = a[getColumnIndex(key)];
+    let bValue = b[getColumnIndex(key)];
+    
+    if (key === 'date') {
+      const [dateA, timeA] = aValue.split(' ');
+      const [dayA, monthA, yearA] = dateA.split('/');
+      const dateObjA = new Date(`${yearA}-${monthA}-${dayA} ${timeA}`);
+
+      const [dateB, timeB] = bValue.split(' ');
+      const [dayB, monthB, yearB] = dateB.split('/');
+      const dateObjB = new Date(`${yearB}-${monthB}-${dayB} ${timeB}`);
+
+      // Rows without a known date ('') sort as the oldest
+      const epochA = dateObjA.getTime() || 0;
+      const epochB = dateObjB.getTime() || 0;
+      return direction === 'asc' ? epochA - epochB : epochB - epochA;
+    }
+    
+    if (typeof aValue === 'string') {
+      aValue = aValue.toLowerCase();
+      bValue = bValue.toLowerCase();
+    }
+    
+    if (aValue < bValue) return direction === 'asc' ? -1 : 1;
+    if (aValue > bValue) return direction === 'asc' ? 1 : -1;
+    return 0;
+  });
+};
+
+// ===============================
+// History Cache
+// ===============================
+// Loaded rows live in sessionStorage (cleared on logout) so revisits only fetch new activity
+const historyCacheKey = (username) => `atelier_history_${username}`;
+
+const loadHistoryCache = (username) => {
+  try {
+    return JSON.parse(sessionStorage.getItem(historyCacheKey(username)));
+  } catch (error) {
+    return null;
+  }
+};
+
+const saveHistoryCache = (cache) => {
+  try {
+    sessionStorage.setItem(historyCacheKey(cache.username), JSON.stringify(cache));
+  } catch (error) {
+    // Over the storage quota (e.g. old inline images); the next visit loads in full
+    sessionStorage.removeItem(historyCacheKey(cache.username));
+  }
+};
+
 // ===============================
 // Main UserHistory Component
 // ===============================
@@ -85,37 +139,65 @@ function UserHistory() {
   const [sortConfig, setSortConfig] = useState({ key: 'date', direction: 'desc' });
   const [currentPage, setCurrentPage] = useState(1);
   const [itemsPerPage] = useState(10);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
   const dropdownRef = React.useRef(null);
+  const cacheRef = React.useRef(null);
+  const fetchLimit = 50;
 
-  // Data fetching and initialization
-  useEffect(() => {
-    fetch('/v1/user/info')
+  // Fetch one page of history older than the given cursor
+  const fetchHistoryPage = (cursor) => {
+    const params = new URLSearchParams({ limit: fetchLimit });
+    if (cursor !== null) params.append('before', cursor);
+    return fetch(`/v1/user/history?${params}`).then(response => response.json());
+  };
+
+  // Merge activity newer than the cached rows, or load the first page if the cache is missing or stale
+  const syncHistory = (user) => {
+    const cache = loadHistoryCache(user);
+    const params = new URLSearchParams({ limit: fetchLimit, urls: 1 });
+    if (cache) params.append('after', cache.latestId);
+    return fetch(`/v1/user/history/sync?${params}`)
       .then(response => response.json())
       .then(data => {
-        setUsername(data.username);
-        setCredits(data.credits);
+        if (!cache) {
+          return {
+            username: user,
+            rows: data.history,
+            latestId: data.latest_id,
+            total: data.total,
+            nextCursor: data.next_cursor
+          };
+        }
+        // History was cleared elsewhere or too much is new; start over
+        if (data.reset) {
+          sessionStorage.removeItem(historyCacheKey(user));
+          return syncHistory(user);
+        }
+        return {
+          ...cache,
+          rows: [...data.history, ...cache.rows],
+          latestId: data.latest_id,
+          total: cache.total + data.history.length
+        };
       });
+  };
 
-    fetch('/v1/presets/menu')
-      .then(response => response.json())
-      .then(data => setMenuItems(data.menu_items))
-      .catch(error => console.error('Error fetching menu items:', error));
-
-    fetch('/v1/user/history')
+  // Data fetching and initialization
+  useEffect(() => {
+    fetch('/v1/bootstrap')
       .then(response => response.json())
       .then(data => {
-        const sortedData = [...data.history].sort((a, b) => {
-          const [dateA, timeA] = a[getColumnIndex('date')].split(' ');
-          const [dayA, monthA, yearA] = dateA.split('/');
-          const dateObjA = new Date(`${yearA}-${monthA}-${dayA} ${timeA}`);
-
-          const [dateB, timeB] = b[getColumnIndex('date')].split(' ');
-          const [dayB, monthB, yearB] = dateB.split('/');
-          const dateObjB = new Date(`${yearB}-${monthB}-${dayB} ${timeB}`);
-
-          return dateObjB - dateObjA;
-        });
-        setHistory(sortedData);
+        setUsername(data.username);
+        setCredits(data.credits);
+        setMenuItems(data.menu_items);
+        return syncHistory(data.username);
+      })
+      .then(cache => {
+        cacheRef.current = cache;
+        saveHistoryCache(cache);
+        setHistory(sortRows(cache.rows, 'date', 'desc'));
+        setNextCursor(cache.nextCursor);
         setIsLoading(false);
       })
       .catch(error => {
@@ -135,6 +217,56 @@ function UserHistory() {
     };
   }, []);
 
+  // Keep credit balance current through the live event stream while the page is visible
+  useEffect(() => {
+    let events = null;
+    const connect = () => {
+      events = new EventSource('/v1/events');
+      events.addEventListener('credits', (e) => setCredits(JSON.parse(e.data).credits));
+    };
+    const onVisibilityChange = () => {
+      if (document.hidden && events) {
+        events.close();
+        events = null;
+      } else if (!document.hidden && !events) {
+        connect();
+      }
+    };
+
+    if (!document.hidden) connect();
+    document.addEventListener('visibilitychange', onVisibilityChange);
+    return () => {
+      document.removeEventListener('visibilitychange', onVisibilityChange);
+      if (events) events.close();
+    };
+  }, []);
+
+  // Fetch the next page once the user reaches the last loaded page
+  useEffect(() => {
+    if (isLoading || isLoadingMore || nextCursor === null) return;
+    if (currentPage < Math.ceil(history.length / itemsPerPage)) return;
+
+    setIsLoadingMore(true);
+    fetchHistoryPage(nextCursor)
+      .then(data => {
+        // A synced row that committed late can reappear in an older page; rows end with their id
+        const known = new Set((cacheRef.current ? cacheRef.current.rows : history).map(row => row[row.length - 1]));
+        const older = data.history.filter(row => !known.has(row[row.length - 1]));
+        setHistory(prev => sortRows([...prev, ...older], sortConfig.key, sortConfig.direction));
+        setNextCursor(data.next_cursor);
+        if (cacheRef.current) {
+          cacheRef.current = {
+            ...cacheRef.current,
+            rows: [...cacheRef.current.rows, ...older],
+            nextCursor: data.next_cursor
+          };
+          saveHistoryCache(cacheRef.current);
+        }
+      })
+      .catch(error => console.error('Error fetching more history:', error))
+      .finally(() => setIsLoadingMore(false));
+  }, [currentPage, history.length, nextCursor, isLoading]);
+
   // Event handlers
   const toggleDropdown = () => {
     setIsDropdownOpen(!isDropdownOpen);
@@ -253,34 +385,7 @@ function UserHistory() {
       direction = 'desc';
     }
     setSortConfig({ key, direction });
-    
-    const sortedData = [...history].sort((a, b) => {
-      let aValue = a[getColumnIndex(key)];
-      let bValue = b[getColumnIndex(key)];
-      
-      if (key === 'date') {
-        const [dateA, timeA] = aValue.split(' ');
-        const [dayA, monthA, yearA] = dateA.split('/');
-        const dateObjA = new Date(`${yearA}-${monthA}-${dayA} ${timeA}`);
-
-        const [dateB, timeB] = bValue.split(' ');
-        const [dayB, monthB, yearB] = dateB.split('/');
-        const dateObjB = new Date(`${yearB}-${monthB}-${dayB} ${timeB}`);
-
-        return direction === 'asc' ? dateObjA - dateObjB : dateObjB - dateObjA;
-      }
-      
-      if (typeof aValue === 'string') {
-        aValue = aValue.toLowerCase();
-        bValue = bValue.toLowerCase();
-      }
-      
-      if (aValue < bValue) return direction === 'asc' ? -1 : 1;
-      if (aValue > bValue) return direction === 'asc' ? 1 : -1;
-      return 0;
-    });
-    
-    setHistory(sortedData);
+    setHistory(sortRows(history, key, direction));
   };
 
   const indexOfLastItem = currentPage * itemsPerPage;
@@ -292,7 +397,7 @@ function UserHistory() {
   const Pagination = () => (
     <div className="pagination">
       <div className="pagination-info">
-        Showing {indexOfFirstItem + 1}-{Math.min(indexOfLastItem, history.length)} of {history.length} results
+        Showing {indexOfFirstItem + 1}-{Math.min(indexOfLastItem, history.length)} of {history.length}{nextCursor !== null ? '+' : ''} results
       </div>
       <div className="pagination-controls">
         <button 
@@ -148,20 +148,16 @@ function SettingsPage() {
 
   // Data Fetching
   useEffect(() => {
-    // Fetch user info
-    fetch('/v1/user/info')
+    // Fetch user info and menu items
+    fetch('/v1/bootstrap')
       .then(response => response.json())
       .then(data => {
         setUsername(data.username);
         setCredits(data.credits);
+        setMenuItems(data.menu_items);
         setIsLoading(false);
-      });
-
-    // Fetch menu items
-    fetch('/v1/presets/menu')
-      .then(res => res.json())
-      .then(data => setMenuItems(data.menu_items))
-      .catch(error => console.error('Error fetching menu:', error));
+      })
+      .catch(error => console.error('Error fetching bootstrap data:', error));
 
     // Dropdown click outside handler
     const handleClickOutside = (event) => {
@@ -172,10 +168,10 @@ function SettingsPage() {
 
     document.addEventListener("mousedown", handleClickOutside);
 
-    // Check if user has any history
-    fetch('/v1/user/history')
+    // Check if user has any history (compact sync: counts only, no image URLs)
+    fetch('/v1/user/history/sync?limit=1')
       .then(res => res.json())
-      .then(data => setHasHistory(data.history.length > 0))
+      .then(data => setHasHistory(data.total > 0))
       .catch(error => console.error('Error checking history:', error));
 
     return () => document.removeEventListener("mousedown", handleClickOutside);
@@ -10,6 +10,29 @@ function clearSessionStorage() {
   sessionStorage.clear();
 }
 
+// Unique key per action so a retried request is only processed once
+function newIdempotencyKey() {
+  return window.crypto && crypto.randomUUID
+    ? crypto.randomUUID()
+    : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+}
+
+// Send a request, retrying network failures and in-progress replies with the same
+// key so the server processes the action once
+async function fetchIdempotent(url, options, key, attempts = 3) {
+  for (let attempt = 1; ; attempt++) {
+    try {
+      const response = await fetch(url, { ...options, headers: { ...options.headers, 'Idempotency-Key': key } });
+      const retryAfter = response.headers.get('Retry-After');
+      if (response.status !== 409 || !retryAfter || attempt >= attempts) return response;
+      await new Promise(resolve => setTimeout(resolve, parseInt(retryAfter, 10) * 1000));
+    } catch (error) {
+      if (attempt >= attempts) throw error;
+      await new Promise(resolve => setTimeout(resolve, attempt * 1000));
+    }
+  }
+}
+
 function handleLogout() {
   fetch('/v1/user/logout', {
     method: 'GET',
@@ -193,6 +216,8 @@ function TopupPage() {
   const [isRainbowAnimating, setIsRainbowAnimating] = useState(false);
   const [isProcessing, setIsProcessing] = useState(false);
   const dropdownRef = React.useRef(null);
+  // Purchase key kept until the server answers, so clicking again after a network error retries the same purchase
+  const pendingPurchase = React.useRef(null);
 
   // Animation Handlers
   const triggerRainbowAnimation = () => {
@@ -202,23 +227,17 @@ function TopupPage() {
 
   // Data Fetching
   useEffect(() => {
-    // Fetch user info
-    fetch('/v1/user/info')
+    // Fetch user info, menu items and credit bundles
+    fetch('/v1/bootstrap')
       .then(response => response.json())
       .then(data => {
         setUsername(data.username);
         setCredits(data.credits);
+        setMenuItems(data.menu_items);
+        setCreditBundles(data.bundles);
         setIsLoading(false);
-      });
-
-    // Fetch menu items and credit bundles
-    Promise.all([
-      fetch('/v1/presets/menu').then(res => res.json()),
-      fetch('/v1/credits/bundles').then(res => res.json())
-    ]).then(([menuData, bundleData]) => {
-      setMenuItems(menuData.menu_items);
-      setCreditBundles(bundleData);
-    }).catch(error => console.error('Error fetching data:', error));
+      })
+      .catch(error => console.error('Error fetching data:', error));
 
     // Dropdown click outside handler
     const handleClickOutside = (event) => {
@@ -240,17 +259,28 @@ function TopupPage() {
     setIsProcessing(true);
     setIsRainbowAnimating(true);
     
+    // The server hands out a signed ticket that only becomes valid after a short delay
+    const confirmRedeem = (ticket, delay) => new Promise(resolve => setTimeout(resolve, delay * 1000))
+      .then(() => fetch('/v1/credits/redeem/confirm', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ ticket }),
+      }))
+      .then(response => response.json())
+      .then(data => data.retry_after ? confirmRedeem(ticket, data.retry_after) : data);
+
     fetch('/v1/credits/redeem', {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
       body: JSON.stringify({ pin_code: pinCode }),
     })
     .then(response => response.json())
+    .then(data => data.ticket ? confirmRedeem(data.ticket, data.retry_after) : data)
     .then(data => {
-      setMessage(data.message);
+      setMessage(data.message || data.error);
       if (data.success) {
         const newBalance = parseInt(data.message.split('New balance: ')[1]);
-        const creditsAdded = newBalance - credits;
+        const creditsAdded = parseInt(data.message.split('added ')[1]);
         setCredits(newBalance);
         fireConfetti(creditsAdded);
       }
@@ -270,15 +300,20 @@ function TopupPage() {
     setIsProcessing(true);
     setIsRainbowAnimating(true);
 
-    fetch('/v1/credits/purchase', {
+    if (!pendingPurchase.current || pendingPurchase.current.bundleSize !== bundleSize) {
+      pendingPurchase.current = { bundleSize, key: newIdempotencyKey() };
+    }
+
+    fetchIdempotent('/v1/credits/purchase', {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
       },
       body: JSON.stringify({ bundle_size: bundleSize }),
-    })
+    }, pendingPurchase.current.key)
     .then(response => response.json())
     .then(data => {
+      pendingPurchase.current = null;
       if (data.success) {
         // Extract PIN from the message using the format "PIN code is: XXXXXXXX"
         const pinMatch = data.message.match(/PIN code is: ([A-Z0-9]+)/);
@@ -0,0 +1,40 @@
+import io
+import zipfile
+
+class ZipStream(io.RawIOBase):
+    """Atelier ZIP Stream System. Copyright (C) 2024 Ikmal Said. All rights reserved."""
+    def __init__(self):
+        """Initialize write-only, non-seekable buffer that is drained after every entry"""
+        self._chunks = []
+
+    def writable(self):
+        """Report buffer as writable for zipfile"""
+        return True
+
+    def write(self, data):
+        """Collect bytes written by zipfile"""
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        """Return and clear everything written since the last drain"""
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+    def generate(self, files):
+        """
+        Yield a ZIP archive chunk by chunk from (filename, data) pairs.
+
+        zipfile falls back to data descriptors on non-seekable output, so only
+        one entry is held in memory at a time and nothing touches the disk.
+        """
+        with zipfile.ZipFile(self, 'w', compression=zipfile.ZIP_STORED) as zipf:
+            for filename, data in files:
+                zipf.writestr(filename, data)
+                chunk = self.drain()
+                if chunk:
+                    yield chunk
+        chunk = self.drain()
+        if chunk:
+            yield chunk
@@ -6,9 +6,10 @@ from utils.database import Database
 
 class Credits:
     """Atelier Credits System. Copyright (C) 2024 Ikmal Said. All rights reserved."""
-    def __init__(self):
-        """Initialize credit system with predefined bundles and empty pin codes"""
-        self.db = Database()
+    def __init__(self, db=None, pin_lifetime=7 * 86400):
+        """Initialize credit system with predefined bundles; PIN codes live in the database"""
+        self.db = db if db is not None else Database()
+        self.pin_lifetime = pin_lifetime
         
         self.currency = 'MYR'
         
@@ -17,8 +18,6 @@ class Credits:
             'Medium': {'credits': 100, 'price': 17.99},
             'Large': {'credits': 1000, 'price': 89.99}
         }
-        
-        self.pin_codes = {}
 
     def get_current_timestamp(self):
         """Return formatted timestamp string for current date and time"""
@@ -28,14 +27,18 @@ class Credits:
         """Return dictionary of available credit bundle options"""
         return self.credit_bundles
 
-    def generate_pin_code(self, bundle_size):
-        """Generate unique 8-character PIN code for credit bundle redemption"""
+    def generate_pin_code(self, user_id, bundle_size):
+        """Generate and store unique 8-character PIN code for credit bundle redemption"""
+        credits = self.credit_bundles[bundle_size]['credits']
         while True:
-            pin = ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
-            if pin not in self.pin_codes:
-                self.pin_codes[pin] = bundle_size
+            pin = ''.join(random.SystemRandom().choices(string.ascii_uppercase + string.digits, k=8))
+            if self.db.add_pin_code(pin, bundle_size, credits, user_id, self.pin_lifetime):
                 return pin
 
+    def sweep_pin_codes(self):
+        """Delete expired PIN codes"""
+        return self.db.prune_pin_codes()
+
     def process_payment(self, user_id, bundle_size):
         """Process simulated payment transaction and return status with transaction details"""
         success = random.choice([True, False])
@@ -61,12 +64,11 @@ class Credits:
                 task=f'Attempted to purchase {self.credit_bundles[bundle_size]["credits"]} credits',
                 detail=f'Package: {bundle_size} | Price: {self.currency}{self.credit_bundles[bundle_size]["price"]:.2f}',
                 status='failed',
-                timestamp=self.get_current_timestamp(),
                 result_url=None
             )
             return False, error_message
 
-        pin_code = self.generate_pin_code(bundle_size)
+        pin_code = self.generate_pin_code(user_id, bundle_size)
         
         self.db.add_user_history(
             user_id=user_id,
@@ -74,22 +76,17 @@ class Credits:
             task=f'Purchased {self.credit_bundles[bundle_size]["credits"]} credits',
             detail=f'Package: {bundle_size} | Price: {self.currency}{self.credit_bundles[bundle_size]["price"]:.2f} | PIN Code: {pin_code}',
             status='success',
-            timestamp=self.get_current_timestamp(),
             result_url=None
         )
         return True, pin_code
 
     def redeem_pin_code(self, user_id, pin_code):
         """Validate PIN code and add corresponding credits to user account"""
-        if pin_code not in self.pin_codes:
+        redeemed = self.db.redeem_pin_code(user_id, pin_code)
+        if redeemed is None:
             return False, "Invalid PIN code"
 
-        bundle_size = self.pin_codes[pin_code]
-        credits_to_add = self.credit_bundles[bundle_size]['credits']
-
-        current_credits = self.db.get_user_credits(user_id)
-        new_credits = current_credits + credits_to_add
-        self.db.update_user_credits(user_id, new_credits)
+        bundle_size, credits_to_add, new_credits = redeemed
 
         self.db.add_user_history(
             user_id=user_id,
@@ -97,11 +94,10 @@ class Credits:
             task=f'Redeemed {credits_to_add} credits',
             detail=f'Package: {bundle_size} | Price: {self.currency}{self.credit_bundles[bundle_size]["price"]:.2f}',
             status='success',
-            timestamp=self.get_current_timestamp(),
             result_url=None
         )
 
-        del self.pin_codes[pin_code]
+        self.db.add_user_event(user_id, 'credits', {'credits': new_credits})
 
         return True, f"Successfully added {credits_to_add} credits. New balance: {new_credits}"
 
@@ -129,26 +125,26 @@ if __name__ == "__main__":
                 print(f"Error: User '{username}' not found")
                 exit(1)
                 
-            current_credits = sc.db.get_user_credits(user_id)
-            new_credits = current_credits + amount
-            
-            # Check if deduction would result in negative balance
-            if new_credits < 0:
-                print(f"Error: Cannot deduct {abs(amount)} credits. User only has {current_credits} credits.")
+            # Deductions are refused atomically if they would result in negative balance
+            if amount < 0:
+                new_credits = sc.db.debit_credits(user_id, -amount, reason='Admin adjustment')
+            else:
+                new_credits = sc.db.add_credits(user_id, amount, reason='Admin adjustment')
+
+            if new_credits is None:
+                print(f"Error: Cannot deduct {abs(amount)} credits. User only has {sc.db.get_user_credits(user_id)} credits.")
                 exit(1)
-                
-            sc.db.update_user_credits(user_id, new_credits)
             
             # Log the credit modification
             sc.db.add_user_history(
                 user_id=user_id,
                 type='Credit Update',
                 task=f'Adjusted credits by {amount:+}',  # Uses +/- sign prefix
-                detail=f'Previous balance: {current_credits} | New balance: {new_credits}',
+                detail=f'Previous balance: {new_credits - amount} | New balance: {new_credits}',
                 status='success',
-                timestamp=sc.get_current_timestamp(),
                 result_url=None
             )
+            sc.db.add_user_event(user_id, 'credits', {'credits': new_credits})
             print(f"Successfully adjusted credits by {amount:+} for {username}. New balance: {new_credits}")
         
         except ValueError:
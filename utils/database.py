@@ -1,15 +1,166 @@
+import os
+import re
+import sys
 import sqlite3
 import secrets
 import string
+import argparse
+import tempfile
+import threading
+import time
+import json
+from queue import Queue, LifoQueue, Empty, Full
+from collections import OrderedDict
+from concurrent.futures import Future
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
+
+class TracedCursor(sqlite3.Cursor):
+    """Cursor that reports statement timings and query plans to the owning Database"""
+
+    def execute(self, sql, parameters=()):
+        """Execute statement, timing it until its rows have been fetched"""
+        self._finish()
+        db = self.connection.db
+        if db.plan_check:
+            db._record_plan(self.connection, sql, parameters)
+        start = time.perf_counter()
+        super().execute(sql, parameters)
+        self._trace = [sql, parameters, time.perf_counter() - start, 0]
+        if self.description is None:
+            self._finish(self.rowcount)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        """Execute statement for every parameter set as one timed call"""
+        self._finish()
+        seq_of_parameters = list(seq_of_parameters)
+        start = time.perf_counter()
+        super().executemany(sql, seq_of_parameters)
+        self._trace = [sql, seq_of_parameters[:1], time.perf_counter() - start, 0]
+        self._finish(self.rowcount)
+        return self
+
+    def _fetched(self, start, rows):
+        """Add fetch time and row count to the running statement"""
+        trace = getattr(self, '_trace', None)
+        if trace:
+            trace[2] += time.perf_counter() - start
+            trace[3] += rows
+
+    def _finish(self, rowcount=None):
+        """Report the running statement, if any"""
+        trace = getattr(self, '_trace', None)
+        if trace:
+            self._trace = None
+            sql, parameters, elapsed, rows = trace
+            self.connection.db._observe_query(sql, parameters, elapsed, rows if rowcount is None else max(rowcount, 0))
+
+    def fetchone(self):
+        """Fetch single row; single-row lookups are reported right away"""
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(start, 1 if row is not None else 0)
+        self._finish()
+        return row
+
+    def fetchmany(self, size=None):
+        """Fetch next batch of rows, reporting once the result set is exhausted"""
+        size = size or self.arraysize
+        start = time.perf_counter()
+        rows = super().fetchmany(size)
+        self._fetched(start, len(rows))
+        if len(rows) < size:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        """Fetch remaining rows and report the statement"""
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(start, len(rows))
+        self._finish()
+        return rows
+
+class TracedConnection(sqlite3.Connection):
+    """Connection whose cursors, including the conn.execute shortcut, are traced"""
+
+    def cursor(self, factory=TracedCursor):
+        """Return traced cursor"""
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        """Execute statement on a traced cursor"""
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        """Execute statement for every parameter set on a traced cursor"""
+        return self.cursor().executemany(sql, seq_of_parameters)
 
 class Database:
     """Atelier Database System. Copyright (C) 2024 Ikmal Said. All rights reserved."""
-    def __init__(self, db_name='atelierdb.db'):
-        """Initialize database connection with specified database name"""
+
+    # Statements EXPLAIN QUERY PLAN can describe; setup and one-off migrations are exempt
+    plan_statements = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'WITH')
+    plan_exempt_methods = ('create_tables', 'migrate_schema', '_apply_migrations')
+
+    # PRAGMA user_version the newest migration in migrate_schema leaves behind
+    schema_version = 2
+
+    # user_list usage tracking applied alongside each credit ledger entry
+    credit_tracking = {
+        'used': 'total_credits_used = total_credits_used + :amount, last_credit_used = :timestamp',
+        'added': 'total_credits_added = total_credits_added + :amount, last_credit_added = :timestamp',
+        'refunded': 'total_credits_used = MAX(total_credits_used - :amount, 0)'
+    }
+
+    def __init__(self, db_name='atelierdb.db', pool_size=8, busy_timeout=5000,
+                 mmap_size=268435456, cache_size=-16000, slow_query_ms=None, plan_check=False, logger=None,
+                 write_behind=False, write_batch_size=256, password_method=None, row_cache_size=1024, row_cache_ttl=5):
+        """
+        Initialize database connection pool with specified database name.
+
+        slow_query_ms logs statements at or above the threshold (0 logs all);
+        plan_check records EXPLAIN QUERY PLAN for every statement into
+        query_plans. Either one switches connections to traced cursors.
+        write_behind hands history, sign-in, generation and credit writes to
+        a single writer thread that commits up to write_batch_size of them
+        per transaction. password_method is a werkzeug hash spec such as
+        'scrypt:32768:8:1' or 'pbkdf2:sha256:600000' (None keeps werkzeug's
+        default); stored hashes with other parameters are upgraded on login.
+        row_cache_size bounds the LRU of username IDs, credit balances and
+        stats; entries expire after row_cache_ttl seconds so writes from
+        other processes show up (0 disables the cache).
+        """
         self.db_name = db_name
+        self.busy_timeout = busy_timeout
+        self.mmap_size = mmap_size
+        self.cache_size = cache_size
+        self.slow_query_ms = slow_query_ms
+        self.plan_check = plan_check
+        self.logger = logger
+        self.password_method = password_method
+        # Resolve shorthand like 'scrypt' to the full parameter prefix werkzeug stores
+        self.password_params = generate_password_hash('', **self._hash_options()).split('$', 1)[0]
+        self.query_plans = []
+        self._pool = LifoQueue(maxsize=pool_size)
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._stats = {'created': 0, 'reused': 0, 'released': 0, 'discarded': 0, 'write_batches': 0, 'writes': 0}
+        self.write_batch_size = write_batch_size
+        self.row_cache_size = row_cache_size
+        self.row_cache_ttl = row_cache_ttl
+        self._row_cache = OrderedDict()
+        self._row_cache_lock = threading.Lock()
+        self._row_cache_epoch = 0
+        self._row_cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+        self._writes = Queue()
+        self._writer = None
+        self._writer_lock = threading.Lock()
+        self.event_listeners = []
         self.create_tables()
+        if write_behind:
+            self.start_writer()
         # self.create_default_user() # Uncomment this line to create a default user
     
     # Please change the default username and password to your own
@@ -25,16 +176,287 @@ class Database:
             return True
         return False
 
+    def _hash_options(self):
+        """Return keyword arguments for generate_password_hash"""
+        return {'method': self.password_method} if self.password_method else {}
+
+    def hash_password(self, password):
+        """Hash password with the configured method and cost"""
+        return generate_password_hash(password, **self._hash_options())
+
+    def needs_rehash(self, password_hash):
+        """Return True if stored hash was made with other parameters than the configured ones"""
+        return password_hash.split('$', 1)[0] != self.password_params
+
     def get_current_timestamp(self):
         """Return current timestamp in dd/mm/yyyy HH:MM:SS format"""
         return datetime.now().strftime('%d/%m/%Y %H:%M:%S')
     
-    def get_connection(self):
-        """Create and return a new database connection with WAL journal mode"""
-        conn = sqlite3.connect(self.db_name)
+    def _count(self, stat, amount=1):
+        """Increment a connection pool statistic"""
+        with self._stats_lock:
+            self._stats[stat] += amount
+
+    def _open_connection(self):
+        """Open a new database connection and apply one-time PRAGMA setup"""
+        traced = self.slow_query_ms is not None or self.plan_check
+        conn = sqlite3.connect(self.db_name, check_same_thread=False,
+                               factory=TracedConnection if traced else sqlite3.Connection)
+        if traced:
+            conn.db = self
         conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout)}')
+        conn.execute(f'PRAGMA mmap_size={int(self.mmap_size)}')
+        conn.execute(f'PRAGMA cache_size={int(self.cache_size)}')
+        self._count('created')
+        return conn
+
+    def _param_shape(self, parameters):
+        """Describe statement parameters by type without logging their values"""
+        if isinstance(parameters, dict):
+            return '{' + ', '.join(f'{key}: {type(value).__name__}' for key, value in parameters.items()) + '}'
+        return '(' + ', '.join(type(value).__name__ for value in parameters) + ')'
+
+    def _observe_query(self, sql, parameters, elapsed, rows):
+        """Log statement if it ran at or above the slow query threshold"""
+        if self.slow_query_ms is None or elapsed * 1000 < self.slow_query_ms:
+            return
+        if parameters and isinstance(parameters, list) and isinstance(parameters[0], (tuple, list, dict)):
+            shape = f'many x {self._param_shape(parameters[0])}'
+        else:
+            shape = self._param_shape(parameters or ())
+        message = f"Slow query ({elapsed * 1000:.1f}ms, {rows} rows, params {shape}): {' '.join(sql.split())}"
+        if self.logger:
+            self.logger.warning(message)
+        else:
+            print(message)
+
+    def _calling_method(self):
+        """Return name of the outermost public Database method on the stack"""
+        name = None
+        frame = sys._getframe(1)
+        while frame is not None:
+            if frame.f_locals.get('self') is self and not frame.f_code.co_name.startswith('_'):
+                name = frame.f_code.co_name
+            frame = frame.f_back
+        return name
+
+    def _record_plan(self, conn, sql, parameters):
+        """Store EXPLAIN QUERY PLAN details of statement with the method that issued it"""
+        if not sql.lstrip().upper().startswith(self.plan_statements):
+            return
+        rows = sqlite3.Connection.execute(conn, f'EXPLAIN QUERY PLAN {sql}', parameters).fetchall()
+        self.query_plans.append((self._calling_method(), ' '.join(sql.split()), [row[3] for row in rows]))
+
+    def get_connection(self):
+        """Return the calling thread's pooled connection, checking one out if needed"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            try:
+                conn = self._pool.get_nowait()
+                self._count('reused')
+            except Empty:
+                conn = self._open_connection()
+            self._local.conn = conn
         return conn
 
+    def release_connection(self, exception=None):
+        """Return the calling thread's connection to the pool (Flask teardown hook)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            return
+        self._local.conn = None
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            self._pool.put_nowait(conn)
+            self._count('released')
+        except (Full, sqlite3.Error):
+            conn.close()
+            self._count('discarded')
+
+    def init_app(self, app):
+        """Release pooled connections at the end of every Flask request"""
+        app.teardown_appcontext(self.release_connection)
+
+    def pool_stats(self):
+        """Return connection pool statistics"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['idle'] = self._pool.qsize()
+        stats['pool_size'] = self._pool.maxsize
+        stats['write_queue'] = self._writes.qsize()
+        return stats
+
+    def _cache_get(self, key):
+        """Return (cached value or None, epoch to hand to _cache_put on a miss)"""
+        if not self.row_cache_size:
+            return None, None
+        with self._row_cache_lock:
+            entry = self._row_cache.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._row_cache.move_to_end(key)
+                self._row_cache_stats['hits'] += 1
+                return entry[1], None
+            if entry is not None:
+                del self._row_cache[key]
+            self._row_cache_stats['misses'] += 1
+            return None, self._row_cache_epoch
+
+    def _cache_put(self, key, value, epoch):
+        """Cache value unless an invalidation ran since the miss that fetched it; returns value"""
+        if value is None or epoch is None:
+            return value
+        with self._row_cache_lock:
+            if epoch == self._row_cache_epoch:
+                self._row_cache[key] = (time.monotonic() + self.row_cache_ttl, value)
+                self._row_cache.move_to_end(key)
+                while len(self._row_cache) > self.row_cache_size:
+                    self._row_cache.popitem(last=False)
+                    self._row_cache_stats['evictions'] += 1
+        return value
+
+    def invalidate_user(self, user_id, username=False):
+        """Drop cached credits and stats of user; username=True also drops their username mapping"""
+        with self._row_cache_lock:
+            self._row_cache_epoch += 1
+            self._row_cache_stats['invalidations'] += 1
+            self._row_cache.pop(('credits', user_id), None)
+            self._row_cache.pop(('stats', user_id), None)
+            if username:
+                for key in [key for key, entry in self._row_cache.items() if key[0] == 'user_id' and entry[1] == user_id]:
+                    del self._row_cache[key]
+
+    def cache_stats(self):
+        """Return row cache size and hit/miss/eviction/invalidation counters"""
+        with self._row_cache_lock:
+            return dict(self._row_cache_stats, entries=len(self._row_cache))
+
+    def start_writer(self):
+        """Start the single writer thread that group-commits queued writes"""
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._writer_loop, name='atelier-db-writer', daemon=True)
+                self._writer.start()
+        return self
+
+    def stop_writer(self):
+        """Commit every queued write and stop the writer thread; later writes run inline"""
+        with self._writer_lock:
+            writer, self._writer = self._writer, None
+            if writer is None:
+                return
+            self._writes.put(None)
+        writer.join()
+
+    def flush(self):
+        """Block until every write queued so far has been committed"""
+        with self._writer_lock:
+            if self._writer is None:
+                return
+            future = Future()
+            self._writes.put((None, (), future, None))
+        future.result()
+
+    def _write(self, fn, *args, wait=True, evict=None):
+        """
+        Run fn(cursor, *args) in a write transaction and return its result.
+
+        With the writer thread running the call is queued and committed along
+        with other pending writes; wait=False returns a Future that resolves
+        once the write is durable instead of blocking for it; failures of
+        those writes are logged since nobody may ever look at the Future.
+        Cached rows of user ID evict are dropped once the transaction has ended.
+        """
+        with self._writer_lock:
+            if self._writer is not None:
+                future = Future()
+                if not wait:
+                    future.add_done_callback(lambda f: self._log_write_failure(fn, f))
+                self._writes.put((fn, args, future, evict))
+            else:
+                future = None
+        if future is not None:
+            return future.result() if wait else future
+
+        try:
+            with self.get_connection() as conn:
+                if not conn.in_transaction:
+                    conn.execute('BEGIN IMMEDIATE')
+                result = fn(conn.cursor(), *args)
+        finally:
+            if evict is not None:
+                self.invalidate_user(evict)
+        if wait:
+            return result
+        future = Future()
+        future.set_result(result)
+        return future
+
+    def _log_write_failure(self, fn, future):
+        """Report a queued write that failed without a caller waiting on it"""
+        error = future.exception()
+        if error is None:
+            return
+        message = f"Queued write {getattr(fn, '__name__', fn)} failed: {error}"
+        if self.logger:
+            self.logger.error(message)
+        else:
+            print(message)
+
+    def _writer_loop(self):
+        """Drain the write queue, committing whatever has piled up in one transaction"""
+        conn = self._open_connection()
+        conn.isolation_level = None
+        running = True
+        while running:
+            batch = [self._writes.get()]
+            while len(batch) < self.write_batch_size:
+                try:
+                    batch.append(self._writes.get_nowait())
+                except Empty:
+                    break
+            running = None not in batch
+            self._commit_batch(conn, [item for item in batch if item is not None])
+        conn.close()
+
+    def _commit_batch(self, conn, batch):
+        """Apply queued writes in one transaction, isolating failures with savepoints"""
+        if not batch:
+            return
+        outcomes = []
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            cursor = conn.cursor()
+            for fn, args, future, _ in batch:
+                if fn is None:
+                    outcomes.append((future, None, None))
+                    continue
+                cursor.execute('SAVEPOINT queued_write')
+                try:
+                    outcomes.append((future, fn(cursor, *args), None))
+                except Exception as e:
+                    cursor.execute('ROLLBACK TO queued_write')
+                    outcomes.append((future, None, e))
+                cursor.execute('RELEASE queued_write')
+            conn.execute('COMMIT')
+        except Exception as e:
+            print(f"Error committing {len(batch)} queued writes: {e}")
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            outcomes = [(future, None, e) for _, _, future, _ in batch]
+
+        for user_id in {evict for _, _, _, evict in batch if evict is not None}:
+            self.invalidate_user(user_id)
+        self._count('write_batches')
+        self._count('writes', len(batch))
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
     def create_tables(self):
         """Create necessary database tables if they don't exist"""
         with self.get_connection() as conn:
@@ -64,6 +486,7 @@ class Database:
                     status TEXT NOT NULL,
                     timestamp TEXT,
                     result_url TEXT,
+                    ts INTEGER,
                     FOREIGN KEY (user_id) REFERENCES user_list (id)
                 )
             ''')
@@ -89,13 +512,156 @@ class Database:
                     FOREIGN KEY (user_id) REFERENCES user_list (id)
                 )
             ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS generation_jobs (
+                    id TEXT PRIMARY KEY,
+                    user_id INTEGER NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    params TEXT,
+                    result TEXT,
+                    error TEXT,
+                    created_ts INTEGER NOT NULL,
+                    updated_ts INTEGER NOT NULL,
+                    owner TEXT,
+                    charged INTEGER NOT NULL DEFAULT 0,
+                    FOREIGN KEY (user_id) REFERENCES user_list (id)
+                )
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_generation_jobs_status
+                ON generation_jobs (status, updated_ts)
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS user_events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER NOT NULL,
+                    event TEXT NOT NULL,
+                    data TEXT,
+                    ts INTEGER NOT NULL
+                )
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_user_events_user
+                ON user_events (user_id, id)
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS credit_ledger (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER NOT NULL,
+                    delta INTEGER NOT NULL,
+                    balance INTEGER NOT NULL,
+                    reason TEXT,
+                    ts INTEGER NOT NULL,
+                    FOREIGN KEY (user_id) REFERENCES user_list (id)
+                )
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_credit_ledger_user
+                ON credit_ledger (user_id, id)
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS pin_codes (
+                    pin TEXT PRIMARY KEY,
+                    bundle TEXT NOT NULL,
+                    credits INTEGER NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    created_ts INTEGER NOT NULL,
+                    expires_ts INTEGER NOT NULL,
+                    FOREIGN KEY (user_id) REFERENCES user_list (id)
+                ) WITHOUT ROWID
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_pin_codes_expires
+                ON pin_codes (expires_ts)
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS idempotency_keys (
+                    user_id INTEGER NOT NULL,
+                    key TEXT NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    status_code INTEGER,
+                    mimetype TEXT,
+                    body BLOB,
+                    expires_ts INTEGER NOT NULL,
+                    PRIMARY KEY (user_id, key)
+                ) WITHOUT ROWID
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires
+                ON idempotency_keys (expires_ts)
+            ''')
+            self.migrate_schema(cursor)
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_user_history_user_ts
+                ON user_history (user_id, ts)
+            ''')
+            # Entries are (user_id, rowid), so history syncs can range over ids
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_user_history_user
+                ON user_history (user_id)
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_user_history_gallery
+                ON user_history (user_id, ts)
+                WHERE status = 'success' AND result_url IS NOT NULL
+            ''')
             conn.commit()
 
+    def migrate_schema(self, cursor):
+        """
+        Upgrade older database files in place, tracked through PRAGMA user_version.
+
+        Runs under BEGIN IMMEDIATE and re-reads the version once the write lock
+        is held, so processes starting together migrate exactly once.
+        """
+        if cursor.execute('PRAGMA user_version').fetchone()[0] >= self.schema_version:
+            return
+
+        conn = cursor.connection
+        if conn.in_transaction:
+            conn.commit()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            version = cursor.execute('PRAGMA user_version').fetchone()[0]
+            self._apply_migrations(cursor, version)
+            cursor.execute('COMMIT')
+        except Exception:
+            cursor.execute('ROLLBACK')
+            raise
+
+    def _apply_migrations(self, cursor, version):
+        """Run every migration newer than version inside the caller's transaction"""
+        if version < 1:
+            # Version 1: sortable epoch timestamps in user_history.ts
+            columns = [row[1] for row in cursor.execute('PRAGMA table_info(user_history)')]
+            if 'ts' not in columns:
+                cursor.execute('ALTER TABLE user_history ADD COLUMN ts INTEGER')
+            rows = cursor.execute('SELECT id, timestamp FROM user_history WHERE ts IS NULL').fetchall()
+            cursor.executemany('UPDATE user_history SET ts = ? WHERE id = ?',
+                               [(self.parse_timestamp(timestamp), history_id) for history_id, timestamp in rows])
+            cursor.execute('PRAGMA user_version = 1')
+
+        if version < 2:
+            # Version 2: owning process and reserved credits of generation jobs
+            columns = [row[1] for row in cursor.execute('PRAGMA table_info(generation_jobs)')]
+            if 'owner' not in columns:
+                cursor.execute('ALTER TABLE generation_jobs ADD COLUMN owner TEXT')
+            if 'charged' not in columns:
+                cursor.execute('ALTER TABLE generation_jobs ADD COLUMN charged INTEGER NOT NULL DEFAULT 0')
+            cursor.execute('PRAGMA user_version = 2')
+
+    def parse_timestamp(self, timestamp):
+        """Convert legacy dd/mm/yyyy HH:MM:SS string to epoch seconds, 0 if unparsable"""
+        try:
+            return int(datetime.strptime(timestamp, '%d/%m/%Y %H:%M:%S').timestamp())
+        except (TypeError, ValueError):
+            return 0
+
     def add_user(self, username, password):
         """Add new user to database with default credits and theme preferences"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            password_hash = generate_password_hash(password)
+            password_hash = self.hash_password(password)
             try:
                 cursor.execute('''
                     INSERT INTO user_list (
@@ -129,102 +695,342 @@ class Database:
                 return user[0]
             return None
 
-    def add_user_history(self, user_id, type, task, detail, status='failed', timestamp=None, result_url=None):
-        """Add new entry to user's activity history"""
+    def login_user(self, username, password, detail='User logged in'):
+        """
+        Verify credentials and record the sign-in; returns user ID if valid.
+
+        The hash is checked outside any transaction, then last_signin and the
+        login history row are written together in one transaction on the same
+        connection (or queued as one write in write-behind mode). A hash made
+        with other parameters than password_method is replaced in the same
+        transaction, unless the password changed meanwhile.
+        """
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            try:
-                cursor.execute('INSERT INTO user_history (user_id, type, task, detail, status, timestamp, result_url) VALUES (?, ?, ?, ?, ?, ?, ?)', 
-                              (user_id, type, task, detail, status, timestamp, result_url))
-                conn.commit()
-                return cursor.lastrowid
-            except Exception as e:
-                raise e
+            cursor.execute('''
+                SELECT id, password_hash, account_enabled 
+                FROM user_list 
+                WHERE username = ?
+            ''', (username,))
+            user = cursor.fetchone()
+        if not (user and user[2] and check_password_hash(user[1], password)):
+            return None
+        rehash = (user[1], self.hash_password(password)) if self.needs_rehash(user[1]) else None
+        self._write(self._record_login, user[0], self.get_current_timestamp(), int(time.time()), detail, rehash,
+                    wait=False, evict=user[0])
+        return user[0]
+
+    def _record_login(self, cursor, user_id, timestamp, ts, detail, rehash=None):
+        """Stamp last signin, append login history and swap in an upgraded hash on an open transaction"""
+        self._update_last_signin(cursor, user_id, timestamp)
+        self._insert_history(cursor, (user_id, 'User Actions', 'Login', detail, 'success', ts, None))
+        if rehash:
+            old_hash, new_hash = rehash
+            cursor.execute('UPDATE user_list SET password_hash = ? WHERE id = ? AND password_hash = ?',
+                           (new_hash, user_id, old_hash))
+
+    def add_user_history(self, user_id, type, task, detail, status='failed', ts=None, result_url=None, wait=True):
+        """Add new entry to user's activity history, stamped with epoch seconds; returns its ID"""
+        return self._write(self._insert_history, (user_id, type, task, detail, status,
+                           int(time.time()) if ts is None else ts, result_url), wait=wait)
+
+    def _insert_history(self, cursor, row):
+        """Insert history row on an open transaction"""
+        cursor.execute('INSERT INTO user_history (user_id, type, task, detail, status, ts, result_url) VALUES (?, ?, ?, ?, ?, ?, ?)', row)
+        return cursor.lastrowid
 
     def get_user_id(self, username):
         """Retrieve user ID by username"""
+        user_id, epoch = self._cache_get(('user_id', username))
+        if user_id is not None:
+            return user_id
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('SELECT id FROM user_list WHERE username = ?', (username,))
             result = cursor.fetchone()
-            return result[0] if result else None
+            return self._cache_put(('user_id', username), result[0] if result else None, epoch)
+
+    def _cursor_clause(self, before):
+        """Keyset condition selecting rows older than the before history id"""
+        if before is None:
+            return ''
+        return 'AND (ts, id) < (SELECT ts, id FROM user_history WHERE id = ?)'
 
-    def get_user_history(self, user_id):
-        """Get complete history of user's activities"""
+    def _page_params(self, user_id, limit, before):
+        """Build query parameters for a keyset page (a limit of -1 means no limit in SQLite)"""
+        params = [user_id]
+        if before is not None:
+            params.append(before)
+        params.append(-1 if limit is None else limit)
+        return params
+
+    def get_user_history(self, user_id, limit=None, before=None):
+        """Get user's activities newest first (epoch ts), optionally one page older than the before cursor"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('SELECT type, task, detail, status, timestamp, result_url FROM user_history WHERE user_id = ? ORDER BY timestamp DESC', (user_id,))
+            cursor.execute(f'''
+                SELECT type, task, detail, status, ts, result_url, id
+                FROM user_history
+                WHERE user_id = ?
+                    {self._cursor_clause(before)}
+                ORDER BY ts DESC, id DESC
+                LIMIT ?
+            ''', self._page_params(user_id, limit, before))
             return cursor.fetchall()
 
-    def get_user_gallery(self, user_id):
-        """Get successful results with URLs from user's history"""
+    def sync_user_history(self, user_id, after=None, limit=50, include_urls=False):
+        """
+        Get activities newer than the after history id for a client-side cache.
+
+        Returns (rows, total, latest_id, reset). Rows are newest first like
+        get_user_history. Without after they are its first page, and total
+        counts all of user's history. With after, only rows with a higher id
+        are read from idx_user_history_user, so a sync with nothing new
+        touches no other rows; total is None and clients add the delta to
+        the count they already hold. Deltas go by id rather than ts because
+        ids are handed out in commit order, while ts is stamped by the caller
+        and a queued write can commit after a newer one. reset is True when
+        the cursor row is gone (history cleared) or more than limit rows are
+        new, and the client should reload instead. latest_id is the highest
+        id seen, the cursor for the next sync. result_url is NULL unless
+        include_urls is set.
+        """
+        columns = f"type, task, detail, status, ts, {'result_url' if include_urls else 'NULL'}, id"
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('''
-                SELECT type, task, detail, timestamp, result_url 
+            if after is None:
+                cursor.execute('BEGIN')
+                cursor.execute('SELECT COUNT(*) FROM user_history WHERE user_id = ?', (user_id,))
+                total = cursor.fetchone()[0]
+                cursor.execute(f'''
+                    SELECT {columns}
+                    FROM user_history
+                    WHERE user_id = ?
+                    ORDER BY ts DESC, id DESC
+                    LIMIT ?
+                ''', (user_id, limit))
+                rows = cursor.fetchall()
+                cursor.execute('SELECT MAX(id) FROM user_history WHERE user_id = ?', (user_id,))
+                latest_id = cursor.fetchone()[0] or 0
+                conn.commit()
+                return rows, total, latest_id, False
+
+            cursor.execute(f'''
+                SELECT {columns}
+                FROM user_history
+                WHERE user_id = ? AND id > ?
+                ORDER BY id DESC
+                LIMIT ?
+            ''', (user_id, after, limit + 1))
+            rows = cursor.fetchall()
+            if not rows:
+                # Nothing newer, or the cursor row no longer exists
+                cursor.execute('SELECT 1 FROM user_history WHERE id = ? AND user_id = ?', (after, user_id))
+                if cursor.fetchone() is None:
+                    return [], None, after, True
+        if len(rows) > limit:
+            return [], None, after, True
+        latest_id = rows[0][-1] if rows else after
+        rows.sort(key=lambda row: (row[4], row[-1]), reverse=True)
+        return rows, None, latest_id, False
+
+    def get_user_gallery(self, user_id, limit=None, before=None):
+        """Get successful results with URLs newest first (epoch ts), optionally one page older than the before cursor"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT type, task, detail, ts, result_url, id
                 FROM user_history 
                 WHERE user_id = ? 
+                    AND status = 'success'
                     AND result_url IS NOT NULL 
-                    AND status = "success"
-                ORDER BY timestamp DESC
-            ''', (user_id,))
+                    {self._cursor_clause(before)}
+                ORDER BY ts DESC, id DESC
+                LIMIT ?
+            ''', self._page_params(user_id, limit, before))
             return cursor.fetchall()
 
+    def iter_user_gallery(self, user_id, batch_size=50):
+        """Yield (ts, result_url, id) for user's gallery through a cursor, batch_size rows at a time"""
+        cursor = self.get_connection().cursor()
+        cursor.execute('''
+            SELECT ts, result_url, id
+            FROM user_history
+            WHERE user_id = ?
+                AND status = 'success'
+                AND result_url IS NOT NULL
+            ORDER BY ts DESC, id DESC
+        ''', (user_id,))
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
+
+    def count_user_gallery(self, user_id):
+        """Count successful results with URLs in user's history"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT COUNT(*)
+                FROM user_history
+                WHERE user_id = ?
+                    AND status = 'success'
+                    AND result_url IS NOT NULL
+            ''', (user_id,))
+            return cursor.fetchone()[0]
+
     def get_user_credits(self, user_id):
         """Get current credit balance for user"""
+        credits, epoch = self._cache_get(('credits', user_id))
+        if credits is not None:
+            return credits
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('SELECT credits FROM user_credits WHERE user_id = ?', (user_id,))
             result = cursor.fetchone()
-            return result[0] if result else 0
+            return self._cache_put(('credits', user_id), result[0], epoch) if result else 0
+
+    def _apply_credit_change(self, cursor, user_id, delta, reason, kind, guard=False):
+        """Apply balance delta, usage tracking and ledger entry on an open transaction; returns new balance"""
+        if guard:
+            # Single-statement debit: only succeeds while the balance covers the amount
+            cursor.execute('''
+                UPDATE user_credits
+                SET credits = credits - ?
+                WHERE user_id = ? AND credits >= ?
+                RETURNING credits
+            ''', (-delta, user_id, -delta))
+        else:
+            cursor.execute('''
+                UPDATE user_credits
+                SET credits = credits + ?
+                WHERE user_id = ?
+                RETURNING credits
+            ''', (delta, user_id))
+        result = cursor.fetchone()
+        if result is None:
+            return None
+
+        cursor.execute(f'''
+            UPDATE user_list
+            SET {self.credit_tracking[kind]}
+            WHERE id = :user_id
+        ''', {'amount': abs(delta), 'timestamp': self.get_current_timestamp(), 'user_id': user_id})
+        cursor.execute('''
+            INSERT INTO credit_ledger (user_id, delta, balance, reason, ts)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (user_id, delta, result[0], reason, int(time.time())))
+        return result[0]
+
+    def debit_credits(self, user_id, amount, reason='Usage'):
+        """Atomically deduct credits if the balance allows; returns new balance or None"""
+        return self._write(self._apply_credit_change, user_id, -amount, reason, 'used', True, evict=user_id)
+
+    def add_credits(self, user_id, amount, reason='Topup'):
+        """Atomically add credits to user's balance; returns new balance or None if user has no balance row"""
+        return self._write(self._apply_credit_change, user_id, amount, reason, 'added', evict=user_id)
+
+    def refund_credits(self, user_id, amount, reason='Refund'):
+        """Atomically return debited credits without counting them as added; returns new balance"""
+        return self._write(self._apply_credit_change, user_id, amount, reason, 'refunded', evict=user_id)
+
+    def update_user_credits(self, user_id, new_credits, reason='Balance set'):
+        """Set user's credit balance, recording the difference in tracking and ledger"""
+        return self._write(self._set_credits, user_id, new_credits, reason, evict=user_id)
 
-    def update_user_credits(self, user_id, new_credits):
-        """Update user's credit balance and tracking"""
+    def _set_credits(self, cursor, user_id, new_credits, reason):
+        """Apply the difference to new_credits on an open transaction"""
+        cursor.execute('SELECT credits FROM user_credits WHERE user_id = ?', (user_id,))
+        result = cursor.fetchone()
+        difference = new_credits - (result[0] if result else 0)
+        return self._apply_credit_change(cursor, user_id, difference, reason, 'added' if difference > 0 else 'used')
+
+    def deduct_credit(self, user_id, value=1):
+        """Deduct specified credits from user's balance"""
+        return self.debit_credits(user_id, value) is not None
+
+    def add_pin_code(self, pin, bundle, credits, user_id, lifetime):
+        """Store redeemable PIN code; returns False if the code already exists"""
+        now = int(time.time())
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            current_credits = self.get_user_credits(user_id)
-            difference = new_credits - current_credits
-            
-            cursor.execute('UPDATE user_credits SET credits = ? WHERE user_id = ?', 
-                          (new_credits, user_id))
-            
-            # Update credit tracking
-            timestamp = self.get_current_timestamp()
-            if difference > 0:
-                cursor.execute('''
-                    UPDATE user_list 
-                    SET total_credits_added = total_credits_added + ?,
-                        last_credit_added = ?
-                    WHERE id = ?
-                ''', (difference, timestamp, user_id))
-            else:
-                cursor.execute('''
-                    UPDATE user_list 
-                    SET total_credits_used = total_credits_used + ?,
-                        last_credit_used = ?
-                    WHERE id = ?
-                ''', (abs(difference), timestamp, user_id))
-            
+            cursor.execute('''
+                INSERT OR IGNORE INTO pin_codes (pin, bundle, credits, user_id, created_ts, expires_ts)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (pin, bundle, credits, user_id, now, now + lifetime))
             conn.commit()
+            return cursor.rowcount == 1
 
-    def deduct_credit(self, user_id, value=1):
-        """Deduct specified credits from user's balance"""
-        current_credits = self.get_user_credits(user_id)
-        if current_credits > 0:
-            self.update_user_credits(user_id, current_credits - value)
-            return True
-        return False
+    def redeem_pin_code(self, user_id, pin, reason='PIN redeemed'):
+        """
+        Consume PIN code and credit its bundle to user in a single transaction.
+
+        The DELETE ... RETURNING claims the code, so concurrent redemptions
+        from any process see it at most once. Returns (bundle, credits,
+        new balance), or None if the code is unknown, expired or already used.
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                DELETE FROM pin_codes
+                WHERE pin = ? AND expires_ts > ?
+                RETURNING bundle, credits
+            ''', (pin, int(time.time())))
+            result = cursor.fetchone()
+            if result is None:
+                return None
+
+            bundle, credits = result
+            balance = self._apply_credit_change(cursor, user_id, credits, f'{reason}: {bundle}', 'added')
+            if balance is None:
+                # No balance row to credit; keep the code redeemable
+                conn.rollback()
+                return None
+            conn.commit()
+            self.invalidate_user(user_id)
+            return bundle, credits, balance
+
+    def prune_pin_codes(self, now=None):
+        """Delete PIN codes that expired before now"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('DELETE FROM pin_codes WHERE expires_ts <= ?', (now or int(time.time()),))
+            conn.commit()
+            return cursor.rowcount
+
+    def get_credit_ledger(self, user_id, limit=50):
+        """Get user's most recent credit ledger entries"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT delta, balance, reason, ts
+                FROM credit_ledger
+                WHERE user_id = ?
+                ORDER BY id DESC
+                LIMIT ?
+            ''', (user_id, limit))
+            return cursor.fetchall()
 
     def close(self):
-        """Close database connection"""
-        pass
+        """Commit queued writes, then close the calling thread's connection and every idle pooled connection"""
+        self.stop_writer()
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            self._local.conn = None
+            conn.close()
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except Empty:
+                break
 
     def update_password(self, user_id, new_password):
         """Update user's password hash"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
             try:
-                password_hash = generate_password_hash(new_password)
+                password_hash = self.hash_password(new_password)
                 cursor.execute('UPDATE user_list SET password_hash = ? WHERE id = ?', 
                               (password_hash, user_id))
                 conn.commit()
@@ -247,6 +1053,8 @@ class Database:
                 return True
             except:
                 return False
+            finally:
+                self.invalidate_user(user_id, username=True)
 
     def update_username(self, user_id, new_username):
         """Update user's username"""
@@ -261,6 +1069,8 @@ class Database:
                 return False
             except:
                 return False
+            finally:
+                self.invalidate_user(user_id, username=True)
 
     def clear_user_history(self, user_id):
         """Delete all history entries for user"""
@@ -310,19 +1120,23 @@ class Database:
         result = cursor.fetchone()
         return result[0] if result else None
 
-    def increment_generations(self, user_id):
+    def increment_generations(self, user_id, wait=False):
         """Increment total generations counter"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                UPDATE user_list 
-                SET total_generations = total_generations + 1 
-                WHERE id = ?
-            ''', (user_id,))
-            conn.commit()
+        return self._write(self._increment_generations, user_id, wait=wait, evict=user_id)
+
+    def _increment_generations(self, cursor, user_id):
+        """Increment total generations counter on an open transaction"""
+        cursor.execute('''
+            UPDATE user_list 
+            SET total_generations = total_generations + 1 
+            WHERE id = ?
+        ''', (user_id,))
 
     def get_user_stats(self, user_id):
         """Get user statistics"""
+        stats, epoch = self._cache_get(('stats', user_id))
+        if stats is not None:
+            return dict(stats)
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
@@ -340,7 +1154,7 @@ class Database:
             ''', (user_id,))
             result = cursor.fetchone()
             if result:
-                return {
+                stats = {
                     'account_enabled': bool(result[0]),
                     'signup_date': result[1],
                     'total_credits_used': result[2],
@@ -350,6 +1164,7 @@ class Database:
                     'last_credit_added': result[6],
                     'last_credit_used': result[7]
                 }
+                return dict(self._cache_put(('stats', user_id), stats, epoch))
             return None
 
     def toggle_account_status(self, user_id, enabled=True):
@@ -362,34 +1177,272 @@ class Database:
                 WHERE id = ?
             ''', (enabled, user_id))
             conn.commit()
-            return True
+        self.invalidate_user(user_id, username=True)
+        return True
 
-    def update_last_signin(self, user_id):
+    def update_last_signin(self, user_id, wait=False):
         """Update user's last signin timestamp"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                UPDATE user_list 
-                SET last_signin = ? 
-                WHERE id = ?
-            ''', (self.get_current_timestamp(), user_id))
-            conn.commit()
+        return self._write(self._update_last_signin, user_id, self.get_current_timestamp(), wait=wait, evict=user_id)
+
+    def _update_last_signin(self, cursor, user_id, timestamp):
+        """Update user's last signin timestamp on an open transaction"""
+        cursor.execute('''
+            UPDATE user_list 
+            SET last_signin = ? 
+            WHERE id = ?
+        ''', (timestamp, user_id))
 
     def get_user_gallery_by_username(self, username):
         """Get successful results with URLs from user's history by username"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
-                SELECT h.type, h.task, h.detail, h.timestamp, h.result_url 
+                SELECT h.type, h.task, h.detail, h.ts, h.result_url 
                 FROM user_history h
                 JOIN user_list u ON h.user_id = u.id
                 WHERE u.username = ? 
+                    AND h.status = 'success'
                     AND h.result_url IS NOT NULL 
-                    AND h.status = "success"
-                ORDER BY h.timestamp DESC
+                ORDER BY h.ts DESC, h.id DESC
             ''', (username,))
             return cursor.fetchall()
 
+    def get_inline_results(self, after_id=0, limit=100):
+        """Get history entries that still hold base64 data URLs, in id order"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, result_url
+                FROM user_history
+                WHERE id > ?
+                    AND result_url LIKE 'data:image%'
+                ORDER BY id
+                LIMIT ?
+            ''', (after_id, limit))
+            return cursor.fetchall()
+
+    def set_result_urls(self, updates):
+        """Replace result URLs for (result_url, history_id) pairs in one transaction"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.executemany('UPDATE user_history SET result_url = ? WHERE id = ?', updates)
+            conn.commit()
+
+    def vacuum(self):
+        """Rebuild database file to reclaim free pages"""
+        conn = self.get_connection()
+        conn.execute('VACUUM')
+
+    def add_job(self, job_id, user_id, params, owner=None):
+        """Persist a newly queued generation job owned by the given process ID"""
+        now = int(time.time())
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO generation_jobs (id, user_id, status, params, created_ts, updated_ts, owner)
+                VALUES (?, ?, 'queued', ?, ?, ?, ?)
+            ''', (job_id, user_id, params, now, now, owner))
+            conn.commit()
+
+    def set_job_charged(self, job_id, amount):
+        """Record credits reserved by a job so they can be refunded if it is abandoned"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('UPDATE generation_jobs SET charged = ? WHERE id = ?', (amount, job_id))
+            conn.commit()
+
+    def touch_jobs(self, owner):
+        """Refresh updated_ts of owner's queued and running jobs to show the process is alive"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE generation_jobs
+                SET updated_ts = ?
+                WHERE status IN ('queued', 'running') AND owner = ?
+            ''', (int(time.time()), owner))
+            conn.commit()
+            return cursor.rowcount
+
+    def update_job(self, job_id, status, result=None, error=None):
+        """Record a job state change with its result or error"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE generation_jobs
+                SET status = ?, result = ?, error = ?, updated_ts = ?
+                WHERE id = ?
+            ''', (status, result, error, int(time.time()), job_id))
+            conn.commit()
+
+    def get_job(self, job_id, user_id):
+        """Get job state if it belongs to user"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, status, result, error, created_ts, updated_ts
+                FROM generation_jobs
+                WHERE id = ? AND user_id = ?
+            ''', (job_id, user_id))
+            result = cursor.fetchone()
+            if result:
+                return {
+                    'job_id': result[0],
+                    'status': result[1],
+                    'result': result[2],
+                    'error': result[3],
+                    'created_ts': result[4],
+                    'updated_ts': result[5]
+                }
+            return None
+
+    def fail_stale_jobs(self, stale_after, error, exclude_owner=None):
+        """
+        Mark queued or running jobs not updated within stale_after seconds as failed.
+
+        Jobs of exclude_owner (the calling process) are left alone. Returns
+        (job_id, user_id, charged) of each failed job so reserved credits
+        can be refunded.
+        """
+        now = int(time.time())
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE generation_jobs
+                SET status = 'failed', error = ?, updated_ts = ?
+                WHERE status IN ('queued', 'running') AND updated_ts < ?
+                    AND owner IS NOT ?
+                RETURNING id, user_id, charged
+            ''', (error, now, now - stale_after, exclude_owner))
+            jobs = cursor.fetchall()
+            conn.commit()
+            return jobs
+
+    def prune_jobs(self, older_than):
+        """Delete finished jobs last updated before the given epoch time"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                DELETE FROM generation_jobs
+                WHERE status IN ('done', 'failed') AND updated_ts < ?
+            ''', (older_than,))
+            conn.commit()
+            return cursor.rowcount
+
+    def add_user_event(self, user_id, event, data):
+        """Append event for user's live stream and notify in-process listeners"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('INSERT INTO user_events (user_id, event, data, ts) VALUES (?, ?, ?, ?)',
+                          (user_id, event, json.dumps(data), int(time.time())))
+            conn.commit()
+            event_id = cursor.lastrowid
+        for listener in self.event_listeners:
+            listener()
+        return event_id
+
+    def get_events_since(self, last_id, limit=500):
+        """Get events of all users newer than last_id, oldest first"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, user_id, event, data
+                FROM user_events
+                WHERE id > ?
+                ORDER BY id
+                LIMIT ?
+            ''', (last_id, limit))
+            return cursor.fetchall()
+
+    def get_user_events_since(self, user_id, last_id, limit=500):
+        """Get user's events newer than last_id, oldest first"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, user_id, event, data
+                FROM user_events
+                WHERE user_id = ? AND id > ?
+                ORDER BY id
+                LIMIT ?
+            ''', (user_id, last_id, limit))
+            return cursor.fetchall()
+
+    def get_last_event_id(self):
+        """Get id of the most recent event or 0 if none"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT MAX(id) FROM user_events')
+            result = cursor.fetchone()
+            return result[0] or 0
+
+    def prune_user_events(self, older_than):
+        """Delete events recorded before the given epoch time"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('DELETE FROM user_events WHERE ts < ?', (older_than,))
+            conn.commit()
+            return cursor.rowcount
+
+    def claim_idempotency_key(self, user_id, key, fingerprint, lease):
+        """
+        Reserve idempotency key for a new request for lease seconds.
+
+        Returns None when the caller now owns the key, otherwise the existing
+        (fingerprint, status_code, mimetype, body) row; status_code is None
+        while the original request is still running. A claim whose lease ran
+        out without a response is taken over by the next request.
+        """
+        now = int(time.time())
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('DELETE FROM idempotency_keys WHERE user_id = ? AND key = ? AND expires_ts <= ?',
+                          (user_id, key, now))
+            cursor.execute('''
+                INSERT OR IGNORE INTO idempotency_keys (user_id, key, fingerprint, expires_ts)
+                VALUES (?, ?, ?, ?)
+            ''', (user_id, key, fingerprint, now + lease))
+            claimed = cursor.rowcount == 1
+            conn.commit()
+            if claimed:
+                return None
+        return self.get_idempotency_key(user_id, key)
+
+    def get_idempotency_key(self, user_id, key):
+        """Get (fingerprint, status_code, mimetype, body) of idempotency key or None"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT fingerprint, status_code, mimetype, body
+                FROM idempotency_keys
+                WHERE user_id = ? AND key = ?
+            ''', (user_id, key))
+            return cursor.fetchone()
+
+    def complete_idempotency_key(self, user_id, key, status_code, mimetype, body, ttl):
+        """Store the response of the request that owns the idempotency key and keep it for ttl seconds"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE idempotency_keys
+                SET status_code = ?, mimetype = ?, body = ?, expires_ts = ?
+                WHERE user_id = ? AND key = ? AND status_code IS NULL
+            ''', (status_code, mimetype, body, int(time.time()) + ttl, user_id, key))
+            conn.commit()
+
+    def release_idempotency_key(self, user_id, key):
+        """Forget in-flight idempotency key so the request can be retried"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('DELETE FROM idempotency_keys WHERE user_id = ? AND key = ? AND status_code IS NULL',
+                          (user_id, key))
+            conn.commit()
+
+    def prune_idempotency_keys(self, now=None):
+        """Delete idempotency keys that expired before now"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('DELETE FROM idempotency_keys WHERE expires_ts <= ?', (now or int(time.time()),))
+            conn.commit()
+            return cursor.rowcount
 
     def set_theme(self, user_id, color=None, font=None):
         """Set user's theme preferences"""
@@ -405,13 +1458,13 @@ class Database:
             if color is not None:
                 columns.append('theme_color')
                 values.append(color)
-                update_parts.append('theme_color = ?')
+                update_parts.append('theme_color = excluded.theme_color')
             
             # Add font if provided
             if font is not None:
                 columns.append('theme_font')
                 values.append(font)
-                update_parts.append('theme_font = ?')
+                update_parts.append('theme_font = excluded.theme_font')
             
             # Construct the SQL query
             columns_str = ', '.join(columns)
@@ -447,3 +1500,276 @@ class Database:
                 'font': result[1] if result else 'Segoe UI'
             }
 
+def check_query_plans(verbose=False):
+    """
+    Exercise every query method against a scratch database with plan recording on.
+
+    Returns (method, sql, plan detail) for each full scan of user_history,
+    which should always be reached through one of its indexes.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, 'plancheck.db'), plan_check=True)
+        user_id = db.add_user('plancheck', 'password')
+        db.store_recovery_key(user_id, 'recovery')
+        for i in range(3):
+            db.add_user_history(user_id, 'Image Generator', f'task {i}', 'detail', 'success', result_url='/v1/images/x')
+        history_id = db.get_user_history(user_id)[0][-1]
+
+        db.get_user_id('plancheck')
+        db.check_user('plancheck', 'password')
+        db.login_user('plancheck', 'password')
+        db.get_user_history(user_id, 10)
+        db.get_user_history(user_id, 10, history_id)
+        db.sync_user_history(user_id, None, 10, True)
+        db.sync_user_history(user_id, history_id, 10)
+        db.get_user_gallery(user_id, 10)
+        db.get_user_gallery(user_id, 10, history_id)
+        list(db.iter_user_gallery(user_id))
+        db.count_user_gallery(user_id)
+        db.get_user_gallery_by_username('plancheck')
+        db.get_inline_results(0, 10)
+        db.set_result_urls([('/v1/images/x', history_id)])
+        db.get_user_credits(user_id)
+        db.debit_credits(user_id, 1)
+        db.add_credits(user_id, 1)
+        db.refund_credits(user_id, 1)
+        db.update_user_credits(user_id, 100)
+        db.get_credit_ledger(user_id)
+        db.add_pin_code('PLANCHEK', 'Small', 10, user_id, 60)
+        db.redeem_pin_code(user_id, 'PLANCHEK')
+        db.prune_pin_codes()
+        db.get_recovery_key(user_id, 'password')
+        db.verify_recovery_key('plancheck', 'recovery')
+        db.increment_generations(user_id)
+        db.get_user_stats(user_id)
+        db.toggle_account_status(user_id, True)
+        db.update_last_signin(user_id)
+        db.update_password(user_id, 'password')
+        db.add_job('plancheck', user_id, '{}', 'plancheck')
+        db.set_job_charged('plancheck', 1)
+        db.touch_jobs('plancheck')
+        db.update_job('plancheck', 'done')
+        db.get_job('plancheck', user_id)
+        db.fail_stale_jobs(600, 'stale')
+        db.prune_jobs(0)
+        db.add_user_event(user_id, 'credits', {})
+        db.get_events_since(0)
+        db.get_user_events_since(user_id, 0)
+        db.get_last_event_id()
+        db.prune_user_events(0)
+        db.claim_idempotency_key(user_id, 'plancheck', 'fingerprint', 60)
+        db.complete_idempotency_key(user_id, 'plancheck', 200, 'application/json', b'{}', 60)
+        db.get_idempotency_key(user_id, 'plancheck')
+        db.release_idempotency_key(user_id, 'plancheck')
+        db.prune_idempotency_keys()
+        db.set_theme(user_id, '#61dafb', 'Segoe UI')
+        db.get_theme(user_id)
+        db.update_username(user_id, 'plancheck')
+        db.clear_user_history(user_id)
+        db.delete_user(user_id)
+        db.close()
+
+        violations = []
+        for method, sql, details in db.query_plans:
+            if method in Database.plan_exempt_methods:
+                continue
+            for detail in details:
+                if verbose:
+                    print(f"{method}: {detail}")
+                match = re.match(r'SCAN (\w+)', detail)
+                # Plans name tables by alias, e.g. "FROM user_history h" shows up as "SCAN h"
+                if match and (match.group(1) == 'user_history' or
+                              re.search(rf'\buser_history\s+(AS\s+)?{match.group(1)}\b', sql, re.IGNORECASE)):
+                    violations.append((method, sql, detail))
+        return violations
+
+def benchmark_login(logins=400, threads=8, users=50):
+    """
+    Compare login throughput of separate check/signin/history calls against login_user.
+
+    Each variant runs with the default password hash and again with a
+    single-iteration hash, which leaves the database work as the main cost.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    def separate_calls(db, username):
+        user_id = db.check_user(username, 'password')
+        db.update_last_signin(user_id, wait=True)
+        db.add_user_history(user_id, 'User Actions', 'Login', 'User logged in', 'success')
+        db.release_connection()
+
+    def single_transaction(db, username):
+        db.login_user(username, 'password')
+        db.release_connection()
+
+    runs = (('separate calls', separate_calls, False),
+            ('login_user', single_transaction, False),
+            ('login_user + write-behind', single_transaction, True))
+    for hash_method in (None, 'pbkdf2:sha256:1'):
+        print(f"Password hash: {hash_method or 'default'}")
+        for label, login, write_behind in runs:
+            with tempfile.TemporaryDirectory() as tmp:
+                db = Database(os.path.join(tmp, 'loginbench.db'), write_behind=write_behind)
+                names = [f'user{i}' for i in range(users)]
+                for name in names:
+                    db.add_user(name, 'password')
+                if hash_method:
+                    with db.get_connection() as conn:
+                        conn.execute('UPDATE user_list SET password_hash = ?',
+                                     (generate_password_hash('password', hash_method),))
+                db.release_connection()
+
+                start = time.perf_counter()
+                with ThreadPoolExecutor(threads) as pool:
+                    list(pool.map(lambda i: login(db, names[i % users]), range(logins)))
+                db.flush()
+                elapsed = time.perf_counter() - start
+                logged = db.get_connection().execute("SELECT COUNT(*) FROM user_history WHERE task = 'Login'").fetchone()[0]
+                db.close()
+            print(f"{label:>26}: {logins / elapsed:.1f} logins/s, {elapsed / logins * 1000:.2f}ms each "
+                  f"({logged} recorded, {threads} threads)")
+
+def stress_credits(threads=16, debits=20, balance=100):
+    """
+    Race parallel debit_credits calls against a fixed balance, with write-behind off and on.
+
+    Returns a list of failure messages: every credit must be spent exactly
+    once, the balance must end at zero and the ledger entries written by
+    the run must add up to the balance change.
+    """
+    failures = []
+    for write_behind in (False, True):
+        mode = 'write-behind' if write_behind else 'inline'
+        with tempfile.TemporaryDirectory() as tmp:
+            db = Database(os.path.join(tmp, 'stress.db'), write_behind=write_behind, row_cache_size=0)
+            user_id = db.add_user('stress', 'password')
+            db.update_user_credits(user_id, balance)
+            db.release_connection()
+
+            start = threading.Barrier(threads)
+            successes = []
+            lock = threading.Lock()
+
+            def debit():
+                start.wait()
+                for _ in range(debits):
+                    # The last successful debit returns a balance of 0
+                    if db.debit_credits(user_id, 1, reason='Stress') is not None:
+                        with lock:
+                            successes.append(1)
+                db.release_connection()
+
+            workers = [threading.Thread(target=debit) for _ in range(threads)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            db.flush()
+
+            final = db.get_user_credits(user_id)
+            ledger = db.get_connection().execute(
+                "SELECT COALESCE(SUM(delta), 0) FROM credit_ledger WHERE user_id = ? AND reason = 'Stress'",
+                (user_id,)).fetchone()[0]
+            db.close()
+
+        print(f"{mode}: {len(successes)} of {threads * debits} debits succeeded, "
+              f"final balance {final}, ledger change {ledger}")
+        if len(successes) != balance:
+            failures.append(f"{mode}: {len(successes)} debits succeeded against a balance of {balance}")
+        if final != 0:
+            failures.append(f"{mode}: final balance is {final}, expected 0")
+        if ledger != final - balance:
+            failures.append(f"{mode}: ledger change {ledger} does not match balance change {final - balance}")
+    return failures
+
+def _time_hash(method, password='calibration-password', rounds=3):
+    """Return median seconds to verify a password hashed with method"""
+    password_hash = generate_password_hash(password, method)
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        check_password_hash(password_hash, password)
+        timings.append(time.perf_counter() - start)
+    return sorted(timings)[len(timings) // 2]
+
+def calibrate_password_hash(target_ms=250, algorithm='scrypt'):
+    """
+    Pick the highest cost whose verification time stays within target_ms on this machine.
+
+    scrypt doubles N (r=8, p=1; memory grows with N); pbkdf2 scales the
+    iteration count from a timed sample. Never goes below werkzeug's
+    defaults, and warns when even those miss the target. Returns the
+    werkzeug method spec.
+    """
+    target = target_ms / 1000
+    if algorithm == 'pbkdf2':
+        sample = 50000
+        elapsed = _time_hash(f'pbkdf2:sha256:{sample}')
+        iterations = max(DEFAULT_PBKDF2_ITERATIONS, int(sample * target / elapsed) // 1000 * 1000)
+        method = f'pbkdf2:sha256:{iterations}'
+        elapsed = _time_hash(method)
+        print(f"{method}: {elapsed * 1000:.1f}ms")
+        if elapsed > target:
+            print(f"Warning: werkzeug's minimum of {DEFAULT_PBKDF2_ITERATIONS} iterations takes longer than {target_ms:g}ms here; keeping it anyway")
+        return method
+
+    n = 32768
+    method = f'scrypt:{n}:8:1'
+    while True:
+        elapsed = _time_hash(f'scrypt:{n}:8:1')
+        print(f"scrypt:{n}:8:1: {elapsed * 1000:.1f}ms, {128 * n * 8 // (1024 * 1024)}MiB")
+        if elapsed > target:
+            if n == 32768:
+                print(f"Warning: werkzeug's minimum of N={n} takes longer than {target_ms:g}ms here; keeping it anyway")
+            break
+        method = f'scrypt:{n}:8:1'
+        if elapsed * 2 > target:
+            break
+        n *= 2
+    return method
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Atelier Database Tools')
+    parser.add_argument('--check-plans', action='store_true',
+                       help='Fail if any query method scans user_history instead of using an index')
+    parser.add_argument('--verbose', action='store_true', help='Print every query plan step')
+    parser.add_argument('--benchmark-login', action='store_true',
+                       help='Compare login throughput of separate calls against login_user')
+    parser.add_argument('--logins', type=int, default=400, help='Logins per run (default: 400)')
+    parser.add_argument('--stress-credits', action='store_true',
+                       help='Fail if parallel debits overspend a fixed balance or leave the ledger inconsistent')
+    parser.add_argument('--debits', type=int, default=20, help='Debits per thread for --stress-credits (default: 20)')
+    parser.add_argument('--threads', type=int, default=None,
+                       help='Concurrent threads (default: 8 for --benchmark-login, 16 for --stress-credits)')
+    parser.add_argument('--calibrate-hash', action='store_true',
+                       help='Find password hash parameters that verify within --target-ms on this machine')
+    parser.add_argument('--target-ms', type=float, default=250, help='Target verification time (default: 250)')
+    parser.add_argument('--algorithm', choices=('scrypt', 'pbkdf2'), default='scrypt',
+                       help='Hash algorithm to calibrate (default: scrypt)')
+
+    args = parser.parse_args()
+
+    if args.check_plans:
+        violations = check_query_plans(args.verbose)
+        for method, sql, detail in violations:
+            print(f"{method}: {detail}\n    {sql}")
+        if violations:
+            print(f"Query plan check failed: {len(violations)} full scan(s) of user_history")
+            sys.exit(1)
+        print("Query plan check passed")
+
+    if args.benchmark_login:
+        benchmark_login(args.logins, args.threads or 8)
+
+    if args.stress_credits:
+        failures = stress_credits(args.threads or 16, args.debits)
+        for failure in failures:
+            print(failure)
+        if failures:
+            print(f"Credit stress test failed: {len(failures)} problem(s)")
+            sys.exit(1)
+        print("Credit stress test passed")
+
+    if args.calibrate_hash:
+        method = calibrate_password_hash(args.target_ms, args.algorithm)
+        print(f"Recommended: ATELIER_PASSWORD_METHOD={method}")
@@ -0,0 +1,110 @@
+import time
+import threading
+from queue import Queue, Empty, Full
+
+class EventBroker:
+    """Atelier Event Broker System. Copyright (C) 2024 Ikmal Said. All rights reserved."""
+    def __init__(self, db, poll_interval=1.0, heartbeat=15, retention=300, queue_size=100):
+        """Initialize broker that fans out user_events rows to live per-user streams"""
+        self.db = db
+        self.poll_interval = poll_interval
+        self.heartbeat = heartbeat
+        self.retention = retention
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._wakeup = threading.Event()
+        self._last_id = db.get_last_event_id()
+        self._thread = None
+        # Events written by this process wake the dispatcher immediately;
+        # events from other processes (e.g. the credits CLI) arrive on the next poll
+        db.event_listeners.append(self._wakeup.set)
+
+    def publish(self, user_id, event, data):
+        """Publish event to every stream of the given user"""
+        return self.db.add_user_event(user_id, event, data)
+
+    def subscribe(self, user_id):
+        """Register a new stream queue for user"""
+        queue = Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(queue)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._dispatch_loop, name='atelier-events', daemon=True)
+                self._thread.start()
+        return queue
+
+    def unsubscribe(self, user_id, queue):
+        """Remove a stream queue for user"""
+        with self._lock:
+            queues = self._subscribers.get(user_id)
+            if queues:
+                queues.discard(queue)
+                if not queues:
+                    del self._subscribers[user_id]
+
+    def subscriber_count(self):
+        """Return number of open streams"""
+        with self._lock:
+            return sum(len(queues) for queues in self._subscribers.values())
+
+    def format_event(self, event_id, event, data):
+        """Format event in text/event-stream wire format"""
+        return f"id: {event_id}\nevent: {event}\ndata: {data}\n\n"
+
+    def stream(self, user_id, last_event_id=None):
+        """Yield server-sent events for user, replaying anything missed since last_event_id"""
+        queue = self.subscribe(user_id)
+        # Events published during the replay are also queued live; skip any already sent
+        last_sent = last_event_id or 0
+        try:
+            yield "retry: 3000\n\n"
+            if last_event_id is not None:
+                for event_id, _, event, data in self.db.get_user_events_since(user_id, last_event_id):
+                    last_sent = max(last_sent, event_id)
+                    yield self.format_event(event_id, event, data)
+            # Streams are long-lived; don't hold a pooled connection while idle
+            self.db.release_connection()
+
+            while True:
+                try:
+                    event_id, event, data = queue.get(timeout=self.heartbeat)
+                    if event_id <= last_sent:
+                        continue
+                    last_sent = event_id
+                    yield self.format_event(event_id, event, data)
+                except Empty:
+                    yield ": keepalive\n\n"
+        finally:
+            self.unsubscribe(user_id, queue)
+
+    def _dispatch(self, rows):
+        """Deliver event rows to subscribed queues, dropping events for slow consumers"""
+        with self._lock:
+            targets = [(row, list(self._subscribers.get(row[1], ()))) for row in rows]
+        for (event_id, _, event, data), queues in targets:
+            for queue in queues:
+                try:
+                    queue.put_nowait((event_id, event, data))
+                except Full:
+                    pass
+
+    def prune(self):
+        """Delete events older than the retention window"""
+        return self.db.prune_user_events(int(time.time()) - self.retention)
+
+    def _dispatch_loop(self):
+        """Poll user_events for new rows and fan them out to subscribers"""
+        while True:
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            try:
+                rows = self.db.get_events_since(self._last_id)
+                while rows:
+                    self._last_id = rows[-1][0]
+                    self._dispatch(rows)
+                    rows = self.db.get_events_since(self._last_id)
+            except Exception as e:
+                print(f"Error dispatching events: {e}")
+            finally:
+                self.db.release_connection()
@@ -0,0 +1,96 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+class GenerationCache:
+    """Atelier Generation Cache System. Copyright (C) 2024 Ikmal Said. All rights reserved."""
+
+    key_fields = ('prompt', 'negative_prompt', 'model_name', 'image_size',
+                  'lora_svi', 'lora_flux', 'style_name', 'image_seed')
+
+    def __init__(self, store, max_entries=0):
+        """
+        Initialize LRU cache mapping normalized generation params to stored image URLs.
+
+        Only URLs are held in memory; the images themselves live in the image
+        store, so eviction never deletes anything users can still see.
+        max_entries=0 disables caching and coalescing.
+        """
+        self.store = store
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._stats = {'hits': 0, 'misses': 0, 'coalesced': 0, 'evictions': 0}
+
+    def make_key(self, params):
+        """Return normalized params tuple, or None if the request can't be cached"""
+        try:
+            seed = int(params.get('image_seed') or 0)
+        except (TypeError, ValueError):
+            return None
+        values = {field: ' '.join(str(params.get(field) or '').split()) for field in self.key_fields}
+        values['image_seed'] = seed
+        return tuple(values[field] for field in self.key_fields)
+
+    def _lookup(self, key):
+        """Return cached URL if its image is still stored; caller holds the lock"""
+        url = self._entries.get(key)
+        if url is None:
+            return None
+        if self.store.find(self.store.get_digest(url)) is None:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return url
+
+    def get_or_generate(self, params, generate):
+        """Return image URL for params, calling generate(params) at most once per key at a time"""
+        key = self.make_key(params) if self.max_entries else None
+        if key is None:
+            return generate(params)
+
+        with self._lock:
+            url = self._lookup(key)
+            if url is not None:
+                self._stats['hits'] += 1
+                return url
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+                self._stats['misses'] += 1
+            else:
+                self._stats['coalesced'] += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            url = generate(params)
+        except Exception as e:
+            with self._lock:
+                del self._inflight[key]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            del self._inflight[key]
+            if url:
+                self._entries[key] = url
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self._stats['evictions'] += 1
+        future.set_result(url)
+        return url
+
+    def clear(self):
+        """Forget every cached entry"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Return cache size and hit/miss/coalesced/eviction counters"""
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries), inflight=len(self._inflight))
@@ -0,0 +1,103 @@
+import os
+import time
+import multiprocessing
+from io import BytesIO
+from multiprocessing import shared_memory, resource_tracker
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from PIL import Image
+
+def _save_webp(image, quality):
+    """Encode PIL Image as WebP bytes"""
+    img_io = BytesIO()
+    image.save(img_io, format='WEBP', quality=quality)
+    return img_io.getvalue()
+
+def encode_image(image, quality=90, variants=None, include_original=True):
+    """Encode original and resized variants of PIL Image; returns ({name: webp bytes}, seconds)"""
+    start = time.perf_counter()
+    outputs = {'original': _save_webp(image, quality)} if include_original else {}
+    for name, max_side in (variants or {}).items():
+        resized = image.copy()
+        resized.thumbnail((max_side, max_side), Image.LANCZOS)
+        outputs[name] = _save_webp(resized, quality)
+    return outputs, time.perf_counter() - start
+
+def _encode_shared(shm_name, mode, size, quality, variants, include_original):
+    """Worker entry point: read pixels from shared memory instead of a pickled copy"""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    # The parent owns and unlinks the segment; don't let this process's tracker claim it
+    resource_tracker.unregister(shm._name, 'shared_memory')
+    try:
+        image = Image.frombuffer(mode, size, shm.buf, 'raw', mode, 0, 1)
+        result = encode_image(image, quality, variants, include_original)
+        del image
+        return result
+    finally:
+        shm.close()
+
+class ImageEncoder:
+    """Atelier Image Encoder System. Copyright (C) 2024 Ikmal Said. All rights reserved."""
+    def __init__(self, workers=None, quality=90, variants=None, logger=None):
+        """Initialize WebP encoder backed by a process pool (default two workers, 0 encodes on the calling thread)"""
+        self.workers = min(2, os.cpu_count() or 1) if workers is None else workers
+        self.quality = quality
+        self.variants = variants or {}
+        self.logger = logger
+        self.executor = None
+
+    def start(self):
+        """Start worker processes; call before other threads exist so forking is safe"""
+        if self.workers and self.executor is None:
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+            self.executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+            # Fork every worker now instead of on first use
+            for future in [self.executor.submit(time.sleep, 0) for _ in range(self.workers)]:
+                future.result()
+        return self
+
+    def encode(self, image, include_original=True):
+        """Encode PIL Image and its variants as WebP; returns {name: webp bytes}"""
+        if image.mode not in ('RGB', 'RGBA', 'L'):
+            image = image.convert('RGBA')
+
+        outputs = None
+        executor = self.executor
+        if executor is not None:
+            try:
+                outputs, elapsed = self._encode_in_pool(executor, image, include_original)
+            except BrokenProcessPool as e:
+                # A worker died; forking a new pool from this threaded process isn't safe, so stay inline
+                if self.logger:
+                    self.logger.error(f"Encoder pool broken, encoding inline from now on: {e}")
+                self.shutdown(wait=False)
+            except OSError as e:
+                if self.logger:
+                    self.logger.error(f"Shared memory unavailable, encoding inline: {e}")
+        if outputs is None:
+            outputs, elapsed = encode_image(image, self.quality, self.variants, include_original)
+
+        if self.logger:
+            self.logger.info(f"Encoded {image.size[0]}x{image.size[1]} WebP ({len(outputs)} files) in {elapsed * 1000:.1f}ms")
+        return outputs
+
+    def _encode_in_pool(self, executor, image, include_original):
+        """Hand image pixels to a worker process through shared memory"""
+        data = image.tobytes()
+        shm = shared_memory.SharedMemory(create=True, size=max(len(data), 1))
+        try:
+            shm.buf[:len(data)] = data
+            del data
+            return executor.submit(
+                _encode_shared, shm.name, image.mode, image.size, self.quality, self.variants, include_original
+            ).result()
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def shutdown(self, wait=True):
+        """Stop worker processes"""
+        if self.executor is not None:
+            self.executor.shutdown(wait=wait)
+            self.executor = None
@@ -0,0 +1,55 @@
+import time
+import threading
+
+class Janitor:
+    """Atelier Janitor System. Copyright (C) 2024 Ikmal Said. All rights reserved."""
+    def __init__(self, db=None, tick=1.0):
+        """Initialize shared scheduler that runs periodic cleanup tasks on one thread"""
+        self.db = db
+        self.tick = tick
+        self._lock = threading.Lock()
+        self._tasks = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def schedule(self, name, interval, task):
+        """Register task to run every interval seconds, replacing any task with the same name"""
+        with self._lock:
+            self._tasks[name] = {'interval': interval, 'task': task, 'next_run': time.time() + interval}
+
+    def cancel(self, name):
+        """Unregister task by name"""
+        with self._lock:
+            self._tasks.pop(name, None)
+
+    def start(self):
+        """Start the scheduler thread if it isn't running"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run_loop, name='atelier-janitor', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the scheduler thread"""
+        self._stop.set()
+
+    def run_pending(self):
+        """Run every task that is due and return how many ran"""
+        now = time.time()
+        with self._lock:
+            due = [(name, entry) for name, entry in self._tasks.items() if entry['next_run'] <= now]
+            for _, entry in due:
+                entry['next_run'] = now + entry['interval']
+
+        for name, entry in due:
+            try:
+                entry['task']()
+            except Exception as e:
+                print(f"Error in janitor task {name}: {e}")
+        if due and self.db is not None:
+            self.db.release_connection()
+        return len(due)
+
+    def _run_loop(self):
+        """Wake up every tick and run due tasks until stopped"""
+        while not self._stop.wait(self.tick):
+            self.run_pending()
@@ -0,0 +1,126 @@
+import json
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+class JobQueue:
+    """Atelier Job Queue System. Copyright (C) 2024 Ikmal Said. All rights reserved."""
+    def __init__(self, db, handler, workers=4, max_pending=32, max_pending_per_user=4, retry_after=5, logger=None,
+                 refund=None, stale_after=90):
+        """
+        Initialize bounded worker pool that runs handler(user_id, params, job_id=...) for queued jobs.
+
+        Jobs are stamped with this process's owner ID and kept fresh by
+        heartbeat(); recover() fails other owners' jobs that went stale_after
+        seconds without one and passes the credits they had reserved to
+        refund(user_id, amount).
+        """
+        self.db = db
+        self.handler = handler
+        self.logger = logger
+        self.refund = refund
+        self.stale_after = stale_after
+        self.owner = uuid.uuid4().hex
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_pending_per_user = max_pending_per_user
+        self.retry_after = retry_after
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='atelier-job')
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    def depth(self):
+        """Return number of jobs queued or running in this process"""
+        with self._lock:
+            return sum(self._pending.values())
+
+    def submit(self, user_id, params):
+        """Queue a job and return (job_id, None), or (None, reason) when backpressure applies"""
+        with self._lock:
+            if sum(self._pending.values()) >= self.max_pending:
+                return None, 'queue_full'
+            if self._pending.get(user_id, 0) >= self.max_pending_per_user:
+                return None, 'user_limit'
+            self._pending[user_id] = self._pending.get(user_id, 0) + 1
+
+        job_id = uuid.uuid4().hex
+        try:
+            self.db.add_job(job_id, user_id, json.dumps(params), self.owner)
+            self.publish(user_id, job_id, 'queued')
+            self.executor.submit(self._run, job_id, user_id, params)
+        except Exception:
+            self._done(user_id)
+            raise
+        return job_id, None
+
+    def publish(self, user_id, job_id, status, result=None, error=None):
+        """Publish job state change to the user's event stream"""
+        try:
+            self.db.add_user_event(user_id, 'job', {
+                'job_id': job_id,
+                'status': status,
+                'result': result,
+                'error': error
+            })
+        except Exception as e:
+            if self.logger:
+                self.logger.error(f"Error publishing job {job_id} event: {e}")
+
+    def _done(self, user_id):
+        """Release a pending slot for user"""
+        with self._lock:
+            self._pending[user_id] -= 1
+            if not self._pending[user_id]:
+                del self._pending[user_id]
+
+    def _run(self, job_id, user_id, params):
+        """Execute job on a worker thread and persist its outcome"""
+        try:
+            self.db.update_job(job_id, 'running')
+            self.publish(user_id, job_id, 'running')
+            result = self.handler(user_id, params, job_id=job_id)
+            self.db.update_job(job_id, 'done', result=json.dumps(result))
+            self.publish(user_id, job_id, 'done', result=result)
+        except Exception as e:
+            if self.logger:
+                self.logger.error(f"Error in job {job_id}: {e}")
+            self.db.update_job(job_id, 'failed', error=str(e))
+            self.publish(user_id, job_id, 'failed', error=str(e))
+        finally:
+            self._done(user_id)
+            self.db.release_connection()
+
+    def get(self, job_id, user_id):
+        """Return job state for its owner or None if not found"""
+        job = self.db.get_job(job_id, user_id)
+        if job is None:
+            return None
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def heartbeat(self):
+        """Mark this process's queued and running jobs as still alive"""
+        return self.db.touch_jobs(self.owner)
+
+    def recover(self):
+        """Fail jobs whose process stopped heartbeating, refunding their reserved credits"""
+        error = 'Job interrupted by server restart'
+        jobs = self.db.fail_stale_jobs(self.stale_after, error, exclude_owner=self.owner)
+        for job_id, user_id, charged in jobs:
+            if charged and self.refund:
+                try:
+                    self.refund(user_id, charged)
+                except Exception as e:
+                    if self.logger:
+                        self.logger.error(f"Error refunding abandoned job {job_id}: {e}")
+            self.publish(user_id, job_id, 'failed', error=error)
+        return len(jobs)
+
+    def prune(self, max_age=86400):
+        """Delete finished jobs older than max_age seconds"""
+        return self.db.prune_jobs(int(time.time()) - max_age)
+
+    def shutdown(self, wait=True):
+        """Stop accepting jobs and optionally wait for running ones"""
+        self.executor.shutdown(wait=wait)
@@ -0,0 +1,188 @@
+import time
+import inspect
+import threading
+from functools import wraps
+from contextlib import contextmanager
+
+class Metrics:
+    """Atelier Metrics System. Copyright (C) 2024 Ikmal Said. All rights reserved."""
+
+    default_buckets = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self, buckets=None):
+        """Initialize in-process registry of counters, histograms and callback gauges and counters"""
+        self.buckets = tuple(buckets or self.default_buckets)
+        self._lock = threading.Lock()
+        self._help = {}
+        self._types = {}
+        self._counters = {}
+        self._histograms = {}
+        self._callbacks = {}
+
+    def describe(self, name, kind, help_text):
+        """Register metric type ('counter', 'histogram' or 'gauge') and help text"""
+        self._types[name] = kind
+        self._help[name] = help_text
+
+    def inc(self, name, amount=1, **labels):
+        """Increase counter"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        """Record value in histogram"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            series = self._histograms.get(key)
+            if series is None:
+                series = self._histograms[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['buckets'][i] += 1
+                    break
+            series['sum'] += value
+            series['count'] += 1
+
+    def gauge(self, name, callback, help_text=''):
+        """Register gauge whose value is read from callback() at scrape time"""
+        self.describe(name, 'gauge', help_text)
+        self._callbacks[name] = callback
+
+    def callback_counter(self, name, callback, help_text=''):
+        """Register counter whose running total is kept elsewhere and read from callback() at scrape time"""
+        self.describe(name, 'counter', help_text)
+        self._callbacks[name] = callback
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Observe the duration of the with-block in seconds"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def timed_iter(self, name, iterable, **labels):
+        """Yield from iterable and observe the time until it is exhausted or closed"""
+        start = time.perf_counter()
+        try:
+            yield from iterable
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def instrument(self, obj, name, skip=()):
+        """Wrap public methods of obj so each call is timed under name{method=...}"""
+        for attr, method in inspect.getmembers(obj, inspect.ismethod):
+            if attr.startswith('_') or attr in skip or inspect.isgeneratorfunction(method):
+                continue
+            setattr(obj, attr, self._timed(method, name, attr))
+        return obj
+
+    def _timed(self, method, name, attr):
+        """Return method wrapped with a duration histogram"""
+        @wraps(method)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.observe(name, time.perf_counter() - start, method=attr)
+        return timed
+
+    def _format_labels(self, labels, extra=()):
+        """Format label pairs in exposition format"""
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ''
+        escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+        return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + '}'
+
+    def _snapshot(self):
+        """Copy current series under the lock"""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: {'buckets': list(series['buckets']), 'sum': series['sum'], 'count': series['count']}
+                          for key, series in self._histograms.items()}
+        return counters, histograms
+
+    def _read_callbacks(self):
+        """Read callback gauges and counters, skipping any that fail"""
+        values = {}
+        for name, callback in self._callbacks.items():
+            try:
+                values[name] = callback()
+            except Exception as e:
+                print(f"Error reading metric {name}: {e}")
+        return values
+
+    def render(self):
+        """Return all metrics in Prometheus text exposition format"""
+        counters, histograms = self._snapshot()
+        lines = []
+        described = set()
+
+        def header(name):
+            if name not in described:
+                described.add(name)
+                if name in self._help:
+                    lines.append(f'# HELP {name} {self._help[name]}')
+                lines.append(f'# TYPE {name} {self._types.get(name, "untyped")}')
+
+        for (name, labels), value in sorted(counters.items()):
+            header(name)
+            lines.append(f'{name}{self._format_labels(labels)} {value}')
+
+        for (name, labels), series in sorted(histograms.items()):
+            header(name)
+            cumulative = 0
+            for bound, count in zip(self.buckets, series['buckets']):
+                cumulative += count
+                lines.append(f'{name}_bucket{self._format_labels(labels, [("le", bound)])} {cumulative}')
+            lines.append(f'{name}_bucket{self._format_labels(labels, [("le", "+Inf")])} {series["count"]}')
+            lines.append(f'{name}_sum{self._format_labels(labels)} {series["sum"]}')
+            lines.append(f'{name}_count{self._format_labels(labels)} {series["count"]}')
+
+        for name, value in sorted(self._read_callbacks().items()):
+            header(name)
+            lines.append(f'{name} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+    def quantile(self, q, series):
+        """Estimate quantile from histogram buckets by linear interpolation"""
+        if not series['count']:
+            return 0.0
+        rank = q * series['count']
+        cumulative = 0
+        lower = 0.0
+        for bound, count in zip(self.buckets, series['buckets']):
+            if count and cumulative + count >= rank:
+                return lower + (bound - lower) * (rank - cumulative) / count
+            cumulative += count
+            lower = bound
+        return self.buckets[-1]
+
+    def summary(self):
+        """Return {'histograms': [...], 'counters': [...], 'gauges': {...}} for the status page"""
+        counters, histograms = self._snapshot()
+        gauges = {}
+        for name, value in self._read_callbacks().items():
+            if self._types.get(name) == 'counter':
+                counters[(name, ())] = value
+            else:
+                gauges[name] = value
+        return {
+            'histograms': [{
+                'name': name,
+                'labels': dict(labels),
+                'count': series['count'],
+                'avg': series['sum'] / series['count'] if series['count'] else 0.0,
+                'p50': self.quantile(0.5, series),
+                'p95': self.quantile(0.95, series),
+                'p99': self.quantile(0.99, series)
+            } for (name, labels), series in sorted(histograms.items())],
+            'counters': [{'name': name, 'labels': dict(labels), 'value': value}
+                         for (name, labels), value in sorted(counters.items())],
+            'gauges': gauges
+        }
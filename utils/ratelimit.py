@@ -0,0 +1,215 @@
+import os
+import time
+import sqlite3
+import argparse
+import tempfile
+import threading
+from math import floor
+from limits.storage import Storage
+from limits.storage.base import SlidingWindowCounterSupport, TimestampedSlidingWindow
+
+class SQLiteStorage(Storage, SlidingWindowCounterSupport, TimestampedSlidingWindow):
+    """Atelier Rate Limit Storage System. Copyright (C) 2024 Ikmal Said. All rights reserved."""
+
+    STORAGE_SCHEME = ['sqlite']
+
+    def __init__(self, uri='sqlite:///ratelimit.db', wrap_exceptions=False, busy_timeout=5000,
+                 purge_interval=60, **options):
+        """
+        Initialize counter storage shared by every process that opens the same file.
+
+        Use as storage_uri="sqlite:///relative.db" or "sqlite:////absolute.db".
+        Counters are disposable, so the file runs in WAL mode with
+        synchronous=OFF and every check is a single short write transaction.
+        """
+        self.path = os.path.abspath(uri.split('://', 1)[1][1:] or 'ratelimit.db')
+        self.busy_timeout = int(busy_timeout)
+        self.purge_interval = purge_interval
+        self._local = threading.local()
+        self._next_purge = 0
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self._create_tables()
+
+    @property
+    def base_exceptions(self):
+        """Exceptions wrapped in StorageError when wrap_exceptions is set"""
+        return sqlite3.Error
+
+    def _get_connection(self):
+        """Return this thread's connection, reopening it after a fork"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            # isolation_level=None: transactions are explicit, single statements autocommit
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout / 1000, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            conn.execute(f'PRAGMA busy_timeout={self.busy_timeout}')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _create_tables(self):
+        """Create counter table if it doesn't exist"""
+        self._get_connection().execute('''
+            CREATE TABLE IF NOT EXISTS rate_limits (
+                key TEXT PRIMARY KEY,
+                count INTEGER NOT NULL,
+                expires REAL NOT NULL
+            ) WITHOUT ROWID
+        ''')
+
+    def _purge(self, conn, now):
+        """Delete expired counters at most once per purge_interval instead of on every check"""
+        if now >= self._next_purge:
+            self._next_purge = now + self.purge_interval
+            conn.execute('DELETE FROM rate_limits WHERE expires <= ?', (now,))
+
+    def _incr(self, conn, key, expiry, amount, now):
+        """Increment counter, restarting it if expired; expiry is only set when the counter starts"""
+        return conn.execute('''
+            INSERT INTO rate_limits (key, count, expires) VALUES (:key, :amount, :expires)
+            ON CONFLICT (key) DO UPDATE SET
+                count = CASE WHEN expires <= :now THEN :amount ELSE count + :amount END,
+                expires = CASE WHEN expires <= :now THEN :expires ELSE expires END
+            RETURNING count
+        ''', {'key': key, 'amount': amount, 'expires': now + expiry, 'now': now}).fetchone()[0]
+
+    def _get(self, conn, key, now):
+        """Return live counter value or 0"""
+        result = conn.execute('SELECT count FROM rate_limits WHERE key = ? AND expires > ?', (key, now)).fetchone()
+        return result[0] if result else 0
+
+    def incr(self, key, expiry, amount=1):
+        """Increment the counter for a rate limit key and return its new value"""
+        conn = self._get_connection()
+        now = time.time()
+        self._purge(conn, now)
+        return self._incr(conn, key, expiry, amount, now)
+
+    def get(self, key):
+        """Return the counter value for a rate limit key"""
+        return self._get(self._get_connection(), key, time.time())
+
+    def get_expiry(self, key):
+        """Return the expiry time of a rate limit key"""
+        now = time.time()
+        result = self._get_connection().execute(
+            'SELECT expires FROM rate_limits WHERE key = ? AND expires > ?', (key, now)
+        ).fetchone()
+        return result[0] if result else now
+
+    def check(self):
+        """Check if storage is healthy"""
+        try:
+            self._get_connection().execute('SELECT 1')
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self):
+        """Clear every rate limit and return how many counters were removed"""
+        return self._get_connection().execute('DELETE FROM rate_limits').rowcount
+
+    def clear(self, key):
+        """Reset a rate limit key"""
+        self._get_connection().execute('DELETE FROM rate_limits WHERE key = ?', (key,))
+
+    def _get_sliding_window_info(self, conn, previous_key, current_key, expiry, now):
+        """Return (previous count, previous TTL, current count, current TTL)"""
+        previous_count = self._get(conn, previous_key, now)
+        current_count = self._get(conn, current_key, now)
+        previous_ttl = (1 - (((now - expiry) / expiry) % 1)) * expiry if previous_count else 0.0
+        current_ttl = (1 - ((now / expiry) % 1)) * expiry + expiry
+        return previous_count, previous_ttl, current_count, current_ttl
+
+    def acquire_sliding_window_entry(self, key, limit, expiry, amount=1):
+        """
+        Acquire an entry if the weighted count of both windows stays within limit.
+
+        Reading both windows and incrementing the current one happen under one
+        write lock, so concurrent workers can never over-admit.
+        """
+        if amount > limit:
+            return False
+        conn = self._get_connection()
+        now = time.time()
+        previous_key, current_key = self.sliding_window_keys(key, expiry, now)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            self._purge(conn, now)
+            previous_count, previous_ttl, current_count, _ = self._get_sliding_window_info(
+                conn, previous_key, current_key, expiry, now
+            )
+            weighted_count = previous_count * previous_ttl / expiry + current_count
+            if floor(weighted_count) + amount > limit:
+                conn.execute('COMMIT')
+                return False
+            # New current windows live twice the expiry so they can serve as the next previous window
+            self._incr(conn, current_key, 2 * expiry, amount, now)
+            conn.execute('COMMIT')
+            return True
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def get_sliding_window(self, key, expiry):
+        """Return the previous and current window information"""
+        now = time.time()
+        previous_key, current_key = self.sliding_window_keys(key, expiry, now)
+        return self._get_sliding_window_info(self._get_connection(), previous_key, current_key, expiry, now)
+
+    def clear_sliding_window(self, key, expiry):
+        """Reset both windows of a rate limit key"""
+        previous_key, current_key = self.sliding_window_keys(key, expiry, time.time())
+        self._get_connection().execute('DELETE FROM rate_limits WHERE key IN (?, ?)', (previous_key, current_key))
+
+def _hit_worker(uri, limit, attempts, results):
+    """Benchmark worker: hit one shared key and report how many hits were admitted"""
+    from limits import parse
+    from limits.storage import storage_from_string
+    from limits.strategies import SlidingWindowCounterRateLimiter
+    limiter = SlidingWindowCounterRateLimiter(storage_from_string(uri))
+    item = parse(f'{limit} per minute')
+    results.put(sum(limiter.hit(item, 'shared') for _ in range(attempts)))
+
+def benchmark(iterations=20000, processes=4, limit=100):
+    """Compare per-check latency against memory:// and verify limits hold across processes"""
+    import multiprocessing
+    from limits import parse
+    from limits.storage import storage_from_string
+    from limits.strategies import SlidingWindowCounterRateLimiter
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sqlite_uri = f'sqlite:///{os.path.join(tmp, "ratelimit.db")}'
+        item = parse(f'{iterations * 2} per minute')
+        for uri in ('memory://', sqlite_uri):
+            limiter = SlidingWindowCounterRateLimiter(storage_from_string(uri))
+            start = time.perf_counter()
+            for i in range(iterations):
+                limiter.hit(item, f'client-{i % 100}')
+            elapsed = time.perf_counter() - start
+            print(f"{uri.split('://')[0]:>7}: {elapsed / iterations * 1e6:.1f}us per check ({iterations} checks)")
+
+        context = multiprocessing.get_context('spawn')
+        for uri in ('memory://', sqlite_uri):
+            results = context.Queue()
+            workers = [context.Process(target=_hit_worker, args=(uri, limit, limit, results)) for _ in range(processes)]
+            for worker in workers:
+                worker.start()
+            admitted = sum(results.get() for _ in workers)
+            for worker in workers:
+                worker.join()
+            print(f"{uri.split('://')[0]:>7}: {admitted} hits admitted by {processes} processes (limit {limit})")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Atelier Rate Limit Storage')
+    parser.add_argument('--benchmark', action='store_true',
+                       help='Compare check latency and cross-process correctness against memory://')
+    parser.add_argument('--iterations', type=int, default=20000, help='Checks per backend (default: 20000)')
+    parser.add_argument('--processes', type=int, default=4, help='Worker processes (default: 4)')
+
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.iterations, args.processes)
@@ -0,0 +1,188 @@
+import os
+import re
+import time
+import base64
+import hashlib
+import argparse
+import tempfile
+from PIL import Image
+from utils.database import Database
+
+class ImageStore:
+    """Atelier Image Store. Copyright (C) 2024 Ikmal Said. All rights reserved."""
+    def __init__(self, root='images', url_prefix='/v1/images/', variants=()):
+        """Initialize content-addressed image store under the specified directory"""
+        self.root = os.path.abspath(root)
+        self.url_prefix = url_prefix
+        self.variants = tuple(variants)
+        self.digest_pattern = re.compile(r'^[0-9a-f]{64}$')
+        self.original_pattern = re.compile(r'^([0-9a-f]{64})\.webp$')
+        self._backfill = None
+        os.makedirs(self.root, exist_ok=True)
+
+    def is_digest(self, digest):
+        """Check whether value is a well-formed SHA-256 hex digest"""
+        return bool(digest) and bool(self.digest_pattern.match(digest))
+
+    def get_path(self, digest, variant=None):
+        """Return filesystem path for digest (or one of its variants), sharded by its first two characters"""
+        suffix = f'_{variant}' if variant else ''
+        return os.path.join(self.root, digest[:2], f'{digest}{suffix}.webp')
+
+    def _write(self, path, data):
+        """Write file atomically so readers never see a partial image"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def put(self, data):
+        """Store raw image bytes once per content hash and return the digest"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.get_path(digest)
+        if not os.path.exists(path):
+            self._write(path, data)
+        return digest
+
+    def put_variant(self, digest, variant, data):
+        """Store resized variant bytes alongside the original digest"""
+        if variant not in self.variants:
+            raise ValueError(f"Unknown image variant: {variant}")
+        self._write(self.get_path(digest, variant), data)
+
+    def find(self, digest, variant=None):
+        """Return path of stored image or None if digest/variant is invalid or missing"""
+        if not self.is_digest(digest) or (variant is not None and variant not in self.variants):
+            return None
+        path = self.get_path(digest, variant)
+        return path if os.path.exists(path) else None
+
+    def iter_missing_variants(self):
+        """Yield digests of stored originals that lack one or more variants"""
+        for shard in sorted(os.scandir(self.root), key=lambda entry: entry.name):
+            if not shard.is_dir():
+                continue
+            names = set(os.listdir(shard.path))
+            for name in sorted(names):
+                match = self.original_pattern.match(name)
+                if match and any(f'{match.group(1)}_{variant}.webp' not in names for variant in self.variants):
+                    yield match.group(1)
+
+    def read(self, digest):
+        """Return raw bytes of stored image or None if missing"""
+        path = self.find(digest)
+        if path is None:
+            return None
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def get_url(self, digest, variant=None):
+        """Return public URL reference for digest or one of its variants"""
+        return f'{self.url_prefix}{digest}/{variant}' if variant else f'{self.url_prefix}{digest}'
+
+    def get_variant_urls(self, url):
+        """Return {variant: URL} for a stored reference, or None for legacy data URLs"""
+        digest = self.get_digest(url)
+        if digest is None:
+            return None
+        return {variant: self.get_url(digest, variant) for variant in self.variants}
+
+    def get_digest(self, url):
+        """Extract digest from a stored URL reference or None for other values"""
+        if not url or not url.startswith(self.url_prefix):
+            return None
+        digest = url[len(self.url_prefix):]
+        return digest if self.is_digest(digest) else None
+
+    def load(self, url):
+        """Return raw image bytes for a stored reference or a legacy data URL"""
+        if not url:
+            return None
+        if url.startswith('data:image'):
+            return base64.b64decode(url.split(',', 1)[1])
+        digest = self.get_digest(url)
+        return self.read(digest) if digest else None
+
+    def sweep_temp_files(self, max_age=3600):
+        """Remove partial writes left behind by interrupted puts"""
+        removed = 0
+        cutoff = time.time() - max_age
+        for shard in os.scandir(self.root):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith('.tmp') and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+                    removed += 1
+        return removed
+
+    def migrate(self, db, batch_size=100):
+        """Move inline base64 results from user_history into the store"""
+        migrated = 0
+        last_id = 0
+        while True:
+            rows = db.get_inline_results(last_id, batch_size)
+            if not rows:
+                return migrated
+            updates = []
+            for history_id, result_url in rows:
+                last_id = history_id
+                try:
+                    digest = self.put(self.load(result_url))
+                    updates.append((self.get_url(digest), history_id))
+                except Exception as e:
+                    print(f"Error migrating history entry {history_id}: {e}")
+            db.set_result_urls(updates)
+            migrated += len(updates)
+
+    def backfill_variants(self, encoder, batch_size=20):
+        """
+        Generate missing variants for up to batch_size stored originals.
+
+        Resumes the same store scan on every call so each run stays short;
+        returns the number of images processed, or None once the scan is done.
+        """
+        if self._backfill is None:
+            self._backfill = self.iter_missing_variants()
+
+        processed = 0
+        for digest in self._backfill:
+            try:
+                with Image.open(self.get_path(digest)) as image:
+                    image.load()
+                    outputs = encoder.encode(image, include_original=False)
+                for variant in self.variants:
+                    self.put_variant(digest, variant, outputs[variant])
+            except Exception as e:
+                print(f"Error generating variants for image {digest}: {e}")
+            processed += 1
+            if processed >= batch_size:
+                return processed
+
+        self._backfill = None
+        return processed or None
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Atelier Image Store Manager')
+    parser.add_argument('--migrate', action='store_true',
+                       help='Move base64 images stored in user_history into the image store')
+    parser.add_argument('--vacuum', action='store_true',
+                       help='Reclaim database space after migration')
+    parser.add_argument('--db', default='atelierdb.db', help='Database file (default: atelierdb.db)')
+    parser.add_argument('--root', default='images', help='Image store directory (default: images)')
+
+    args = parser.parse_args()
+
+    if args.migrate:
+        db = Database(args.db)
+        count = ImageStore(args.root).migrate(db)
+        print(f"Migrated {count} images into {args.root}")
+        if args.vacuum:
+            db.vacuum()
+            print("Database vacuumed")